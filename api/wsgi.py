@@ -0,0 +1,319 @@
+"""API HTTP de traitement des documents (application ASGI, sans framework).
+
+Routes :
+- GET  /health     : état du service
+- POST /process    : champ `file` (document) et `footer_text` (optionnel) ; retourne le document traité
+- POST /templates  : champs `templates` (un ou plusieurs templates), `client_data` (JSON),
+                     `footer_text` et `logo` (optionnels) ; retourne le document, ou un ZIP
+                     s'il y a plusieurs templates
+
+Les traitements s'exécutent dans le pool de processus partagé. Le corps d'une requête est lu en
+mémoire, dans la limite de API_MAX_UPLOAD_MB (refusé dès l'en-tête Content-Length s'il la dépasse) ;
+les réponses sont envoyées par morceaux, lus hors de la boucle d'événements.
+En local : `python api/wsgi.py` (nécessite uvicorn).
+"""
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+from concurrent.futures import BrokenExecutor
+from email import policy
+from email.parser import BytesParser
+from pathlib import Path
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from replace_header_footer import (  # noqa: E402
+    SUPPORTED_EXTENSIONS,
+    get_footer_text,
+    get_process_pool,
+    process_client_template,
+    process_file,
+    reset_process_pool,
+)
+from zip_stream import iter_zip_stream  # noqa: E402
+
+# Taille maximale d'une requête (Mo)
+API_MAX_UPLOAD_BYTES = int(os.environ.get("API_MAX_UPLOAD_MB", "200")) * 1024 * 1024
+# Requêtes traitées simultanément, et requêtes en attente au-delà desquelles le service
+# répond 503 plutôt que d'accumuler les envois en mémoire
+API_MAX_CONCURRENT = int(os.environ.get("API_MAX_CONCURRENT", "32"))
+API_MAX_WAITING = int(os.environ.get("API_MAX_WAITING", "128"))
+
+CHUNK_SIZE = 1024 * 1024
+
+MIME_TYPES = {
+    '.docx': "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    '.xlsx': "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    '.pptx': "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    '.zip': "application/zip",
+}
+
+_slots = None
+_waiting = 0
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def check_content_length(headers):
+    """Refuse une requête trop volumineuse avant d'en lire le corps"""
+    try:
+        length = int(headers.get(b"content-length", b"0"))
+    except ValueError:
+        raise HTTPError(400, "En-tête Content-Length invalide")
+    if length > API_MAX_UPLOAD_BYTES:
+        raise HTTPError(413, "Requête trop volumineuse")
+
+
+async def read_body(receive):
+    """Lit le corps de la requête en refusant ceux qui dépassent la taille maximale
+    (corps envoyés par morceaux, sans Content-Length)"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise HTTPError(400, "Connexion interrompue")
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > API_MAX_UPLOAD_BYTES:
+            raise HTTPError(413, "Requête trop volumineuse")
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+def parse_multipart(content_type, body):
+    """Décode un corps multipart/form-data : retourne (champs texte, fichiers).
+
+    fichiers : nom du champ -> liste de (nom du fichier, octets)
+    """
+    if not content_type.lower().startswith(b"multipart/form-data"):
+        raise HTTPError(415, "Corps multipart/form-data attendu")
+    message = BytesParser(policy=policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type + b"\r\n\r\n" + body)
+    if not message.is_multipart():
+        raise HTTPError(400, "Corps multipart invalide")
+    fields = {}
+    files = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        if not name:
+            continue
+        data = part.get_payload(decode=True) or b""
+        filename = part.get_filename()
+        if filename is not None:
+            files.setdefault(name, []).append((os.path.basename(filename.replace("\\", "/")), data))
+        else:
+            fields[name] = data.decode(part.get_content_charset() or "utf-8")
+    return fields, files
+
+
+def _checked_name(filename):
+    file_type = Path(filename).suffix.lower()
+    if not filename or file_type not in SUPPORTED_EXTENSIONS:
+        raise HTTPError(400, f"Format non supporté : {filename or '(sans nom)'}")
+    return filename, file_type
+
+
+async def run_in_thread(function, *args):
+    """Exécute une lecture ou écriture de fichier sans bloquer la boucle d'événements"""
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+async def run_in_pool(function, *args):
+    """Exécute un traitement dans le pool de processus sans bloquer la boucle d'événements"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_pool(), function, *args)
+
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json; charset=utf-8"),
+                            (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_stream(send, chunks, filename, file_type):
+    """Envoie une réponse par morceaux (le document n'est pas chargé en entier en mémoire).
+    
+    Chaque morceau est lu (ou compressé) dans un thread : les autres requêtes ne sont pas bloquées.
+    """
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", MIME_TYPES.get(file_type, "application/octet-stream").encode()),
+                            (b"content-disposition",
+                             f"attachment; filename*=UTF-8''{quote(filename)}".encode())]})
+    chunks = iter(chunks)
+    while True:
+        chunk = await run_in_thread(next, chunks, None)
+        if chunk is None:
+            break
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def _iter_file(path):
+    with open(path, "rb") as f:
+        yield from iter(lambda: f.read(CHUNK_SIZE), b"")
+
+
+async def handle_process(fields, files, workdir, send):
+    uploads = files.get("file")
+    if not uploads or len(uploads) != 1:
+        raise HTTPError(400, "Un fichier attendu dans le champ « file »")
+    filename, file_type = _checked_name(uploads[0][0])
+    input_path = os.path.join(workdir, "input" + file_type)
+    output_path = os.path.join(workdir, "output" + file_type)
+    await run_in_thread(Path(input_path).write_bytes, uploads[0][1])
+    footer_text = fields.get("footer_text") or get_footer_text()
+
+    success = await run_in_pool(process_file, input_path, output_path, file_type, footer_text)
+    if not success or not os.path.exists(output_path):
+        raise HTTPError(422, f"Le traitement de {filename} a échoué")
+    await send_stream(send, _iter_file(output_path), filename, file_type)
+
+
+async def handle_templates(fields, files, workdir, send):
+    templates = files.get("templates")
+    if not templates:
+        raise HTTPError(400, "Au moins un template attendu dans le champ « templates »")
+    try:
+        client_data = json.loads(fields.get("client_data") or "{}")
+    except ValueError:
+        raise HTTPError(400, "client_data doit être un objet JSON")
+    if not isinstance(client_data, dict):
+        raise HTTPError(400, "client_data doit être un objet JSON")
+    footer_text = fields.get("footer_text")
+
+    logo_path = None
+    if files.get("logo"):
+        logo_name, logo_data = files["logo"][0]
+        logo_path = os.path.join(workdir, "logo" + (Path(logo_name).suffix.lower() or ".png"))
+        await run_in_thread(Path(logo_path).write_bytes, logo_data)
+
+    jobs = []
+    used = set()
+    for filename, data in templates:
+        filename, file_type = _checked_name(filename)
+        if filename in used:
+            raise HTTPError(400, f"Template en double : {filename}")
+        used.add(filename)
+        input_path = os.path.join(workdir, f"template_{len(jobs)}{file_type}")
+        await run_in_thread(Path(input_path).write_bytes, data)
+        jobs.append((filename, file_type, input_path, os.path.join(workdir, f"output_{len(jobs)}{file_type}")))
+
+    # Tous les templates sont traités en parallèle
+    results = await asyncio.gather(*(
+        run_in_pool(process_client_template, input_path, output_path, file_type,
+                    client_data, footer_text, logo_path)
+        for _, file_type, input_path, output_path in jobs
+    ))
+    failed = [filename for (filename, *_), success in zip(jobs, results) if not success]
+    if failed:
+        raise HTTPError(422, f"Le traitement a échoué : {', '.join(failed)}")
+
+    if len(jobs) == 1:
+        filename, file_type, _, output_path = jobs[0]
+        await send_stream(send, _iter_file(output_path), filename, file_type)
+    else:
+        entries = [(filename, output_path) for filename, _, _, output_path in jobs]
+        await send_stream(send, iter_zip_stream(entries), "documents.zip", ".zip")
+
+
+ROUTES = {
+    "/process": handle_process,
+    "/templates": handle_templates,
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            reset_process_pool()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """Point d'entrée ASGI"""
+    global _slots, _waiting
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    path = scope["path"].rstrip("/") or "/"
+    if path == "/health":
+        await send_json(send, 200, {"status": "ok"})
+        return
+    handler = ROUTES.get(path)
+    if handler is None:
+        await send_json(send, 404, {"error": "Route inconnue"})
+        return
+    if scope["method"] != "POST":
+        await send_json(send, 405, {"error": "Méthode POST attendue"})
+        return
+
+    if _slots is None:
+        _slots = asyncio.Semaphore(API_MAX_CONCURRENT)
+    if _slots.locked() and _waiting >= API_MAX_WAITING:
+        await send_json(send, 503, {"error": "Service occupé, réessayer plus tard"})
+        return
+    _waiting += 1
+    try:
+        await _slots.acquire()
+    finally:
+        _waiting -= 1
+    try:
+        workdir = tempfile.mkdtemp(prefix="placeandreplace_api_")
+        started = False
+
+        async def tracked_send(message):
+            nonlocal started
+            started = True
+            await send(message)
+
+        try:
+            headers = dict(scope.get("headers") or [])
+            check_content_length(headers)
+            body = await read_body(receive)
+            fields, files = parse_multipart(headers.get(b"content-type", b""), body)
+            del body
+            await handler(fields, files, workdir, tracked_send)
+        except HTTPError as e:
+            if not started:
+                await send_json(send, e.status, {"error": e.message})
+        except BrokenExecutor:
+            # Processus de traitement arrêté brutalement : le pool est recréé à la requête suivante
+            reset_process_pool()
+            if not started:
+                await send_json(send, 503, {"error": "Traitement interrompu, réessayer"})
+        except Exception as e:
+            print(f"❌ Erreur de l'API : {str(e)}")
+            if not started:
+                await send_json(send, 500, {"error": "Erreur interne"})
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        _slots.release()
+
+
+if __name__ == "__main__":
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("uvicorn est nécessaire pour lancer l'API en local : pip install uvicorn")
+    uvicorn.run(app, host=os.environ.get("API_HOST", "127.0.0.1"), port=int(os.environ.get("API_PORT", "8000")))
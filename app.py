@@ -3,22 +3,30 @@ import os
 from pathlib import Path
 import shutil
 from replace_header_footer import (
-    process_file, 
+    process_files,
+    refresh_file,
     get_footer_text, 
     SUPPORTED_EXTENSIONS,
-    setup_folders,
-    SCRIPT_DIR,
-    INPUT_FOLDER,
-    OUTPUT_FOLDER,
-    PDF_OUTPUT_FOLDER,
-    LOGO_PATH,
-    process_client_template
+    render_template_result,
+    generate_for_clients
 )
-import zipfile
 from io import BytesIO
+from zip_stream import iter_zip_stream, write_zip_stream
+from pdf_conversion import convert_files_to_pdf, pdf_conversion_available, pdf_path_for
+from workspaces import get_workspace, new_session_id, QuotaExceededError
 from datetime import datetime
-import sqlite3
-import json
+from client_repository import (
+    setup_database,
+    save_client,
+    get_all_clients,
+    get_client_by_id,
+    get_clients_by_names,
+    count_clients,
+    list_clients,
+    delete_client,
+    CLIENT_PAGE_SIZE
+)
+from collections import defaultdict
 import pandas as pd
 
 st.set_page_config(
@@ -28,6 +36,8 @@ st.set_page_config(
 )
 
 def init_session_state():
+    if 'workspace_id' not in st.session_state:
+        st.session_state.workspace_id = new_session_id()
     if 'processed_files' not in st.session_state:
         st.session_state.processed_files = []
     if 'footer_text' not in st.session_state:
@@ -62,30 +72,113 @@ def init_session_state():
 def create_zip_buffer(files_dict):
     """Crée un buffer ZIP contenant tous les fichiers"""
     zip_buffer = BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for file_path, zip_path in files_dict.items():
-            if os.path.exists(file_path):
-                zip_file.write(file_path, zip_path)
+    entries = [(zip_path, file_path) for file_path, zip_path in files_dict.items() if os.path.exists(file_path)]
+    write_zip_stream(entries, zip_buffer)
     zip_buffer.seek(0)
     return zip_buffer
 
-def reprocess_all_documents():
+def current_workspace():
+    """Espace de travail de la session : documents, sorties, logo et fichiers temporaires isolés
+    des autres utilisateurs"""
+    workspace = get_workspace(st.session_state.workspace_id)
+    if workspace.created and st.session_state.processed_files:
+        # Session inactive trop longtemps : son espace a été nettoyé
+        st.session_state.processed_files = []
+        st.session_state.download_payloads = {}
+        st.info("ℹ️ Votre session a expiré, les documents traités ont été supprimés")
+    return workspace
+
+def convert_documents_to_pdf(file_names, workspace):
+    """Génère la version PDF des documents Word traités avec le pool LibreOffice"""
+    paths = [os.path.join(workspace.output_folder, file) for file in file_names if file.endswith('.docx')]
+    if not paths or not pdf_conversion_available():
+        return
+    try:
+        # Les PDF sont estimés à la taille des documents qu'ils remplacent
+        workspace.ensure_output_space(paths, [pdf_path_for(path, workspace.pdf_folder) for path in paths])
+    except QuotaExceededError as e:
+        st.warning(f"⚠️ Versions PDF non générées : {str(e)}")
+        return
+    
+    progress_bar = st.progress(0)
+    failed = 0
+    for index, (_, pdf_path) in enumerate(convert_files_to_pdf(paths, workspace.pdf_folder)):
+        if pdf_path is None:
+            failed += 1
+        progress_bar.progress((index + 1) / len(paths))
+    progress_bar.progress(1.0)
+    if failed:
+        st.warning(f"⚠️ {failed} version(s) PDF n'ont pas pu être générées")
+
+def file_signature(path):
+    """(chemin, taille, date de modification) : change dès que le fichier est réécrit ; None s'il n'existe pas"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return path, stat.st_size, stat.st_mtime_ns
+
+def session_payload(slot, signature, build):
+    """Contenu à télécharger gardé dans la session, reconstruit seulement lorsque son empreinte change.
+    
+    Un seul contenu par emplacement (fichier ou archive) : il est libéré avec la session.
+    """
+    payloads = st.session_state.setdefault('download_payloads', {})
+    cached = payloads.get(slot)
+    if cached is None or cached[0] != signature:
+        cached = (signature, build())
+        payloads[slot] = cached
+    return cached[1]
+
+def zip_payload(entries):
+    """Archive ZIP des fichiers, reconstruite seulement lorsque l'un d'eux change.
+    
+    entries : tuple de (nom dans l'archive, chemin, taille, date)
+    """
+    return session_payload(
+        "zip", entries,
+        lambda: create_zip_buffer({file_path: zip_path for zip_path, file_path, _, _ in entries}).getvalue()
+    )
+
+def file_payload(path, size, mtime_ns):
+    """Contenu d'un fichier à télécharger, relu seulement lorsqu'il change"""
+    return session_payload(path, (size, mtime_ns), lambda: Path(path).read_bytes())
+
+def reprocess_all_documents(workspace):
     """Retraite tous les documents avec les nouveaux paramètres"""
     if not st.session_state.processed_files:
         return
     
+    input_paths = [os.path.join(workspace.input_folder, file) for file in st.session_state.processed_files]
+    output_paths = [os.path.join(workspace.output_folder, file) for file in st.session_state.processed_files]
+    try:
+        # Les documents mis à jour remplacent les sorties existantes
+        workspace.ensure_output_space(input_paths, output_paths)
+    except QuotaExceededError as e:
+        st.error(f"❌ Documents non mis à jour : {str(e)}")
+        st.session_state.should_reprocess = False
+        return
+    
     progress_text = "Mise à jour des documents..."
     progress_bar = st.progress(0)
     
-    for index, file in enumerate(st.session_state.processed_files):
-        input_path = os.path.join(INPUT_FOLDER, file)
-        output_path = os.path.join(OUTPUT_FOLDER, file)
+    jobs = []
+    for file in st.session_state.processed_files:
+        input_path = os.path.join(workspace.input_folder, file)
+        output_path = os.path.join(workspace.output_folder, file)
         file_type = Path(file).suffix
         
         if os.path.exists(input_path):
-            process_file(input_path, output_path, file_type, st.session_state.footer_text)
-        
-        progress_bar.progress((index + 1) / len(st.session_state.processed_files))
+            jobs.append((input_path, output_path, file_type, st.session_state.footer_text, workspace.logo_path))
+    
+    # Seuls le logo et le pied de page changent : les sorties existantes sont mises à jour
+    # sur place, en parallèle, et la progression suit les résultats
+    for index, _ in enumerate(process_files(jobs, refresh_file)):
+        progress_bar.progress((index + 1) / len(jobs))
+    progress_bar.progress(1.0)
+    
+    # Les versions PDF reflètent le nouveau logo et le nouveau pied de page
+    convert_documents_to_pdf(st.session_state.processed_files, workspace)
     
     st.success("✅ Documents mis à jour avec succès!")
     st.session_state.should_reprocess = False
@@ -99,7 +192,7 @@ SIRET : {footer_data['siretOF']}  - RCS : {footer_data['RCSOF']} - APE : {footer
 Enregistrée sous le numéro NDA {footer_data['NDAOF']} auprès du Préfet de la Région de {footer_data['RégiondrieetsOF']} Cet enregistrement ne vaut pas agrément de l'État
 V1.0 – {footer_data['DatemajdocOF']}"""
 
-def generate_client_documents(uploaded_templates, uploaded_logo):
+def generate_client_documents(uploaded_templates, uploaded_logo, workspace):
     """Génère les documents pour le client"""
     if not uploaded_templates:
         st.error("⚠️ Veuillez d'abord télécharger les templates")
@@ -131,16 +224,13 @@ def generate_client_documents(uploaded_templates, uploaded_logo):
         # Étape 1: Préparation
         update_progress("Préparation de l'environnement")
         
-        # Créer un dossier temporaire pour le client
-        client_folder = os.path.join(OUTPUT_FOLDER, "temp_client")
-        os.makedirs(client_folder, exist_ok=True)
+        # Créer un dossier temporaire pour le client, propre à la session
+        client_folder = workspace.make_temp_folder("client_")
         
         # Sauvegarder le logo du client s'il est fourni
         client_logo_path = None
         if uploaded_logo:
-            client_logo_path = os.path.join(client_folder, "logo.png")
-            with open(client_logo_path, "wb") as f:
-                f.write(uploaded_logo.getvalue())
+            client_logo_path = workspace.write_file(client_folder, "logo.png", uploaded_logo.getvalue())
         
         # Générer le pied de page personnalisé
         footer_text = generate_footer_text(st.session_state.footer_data)
@@ -155,25 +245,19 @@ def generate_client_documents(uploaded_templates, uploaded_logo):
             rapport.append(f"{key} : {value}")
         rapport.append("\nFichiers traités :")
         
-        processed_files = []  # Liste pour suivre les fichiers traités avec succès
+        processed_files = {}  # Documents traités avec succès, gardés en mémoire
         processing_errors = []  # Liste pour suivre les erreurs
         
         # Traiter chaque template
         for i, template_file in enumerate(uploaded_templates):
             file_name = template_file.name
             file_type = os.path.splitext(file_name)[1].lower()
-            output_path = os.path.join(client_folder, file_name)
             
             # Mettre à jour la progression
             update_progress(f"Traitement de {file_name}")
             
             rapport.append(f"\nTraitement de : {file_name}")
             
-            # Sauvegarder le template temporairement
-            temp_path = os.path.join(client_folder, f"temp_{file_name}")
-            with open(temp_path, "wb") as f:
-                f.write(template_file.getvalue())
-            
             # Vérifier si le fichier est supporté
             if file_type not in SUPPORTED_EXTENSIONS:
                 error_msg = f"❌ Échec : Type de fichier non supporté ({file_type})"
@@ -182,44 +266,33 @@ def generate_client_documents(uploaded_templates, uploaded_logo):
                 details_container.warning(f"⚠️ {file_name} : Type de fichier non supporté")
                 continue
             
-            # Traiter le template
+            # Traiter le template en mémoire (un seul chargement, une seule sauvegarde)
             try:
-                success = process_client_template(
-                    temp_path,
-                    output_path,
+                output_data, result = render_template_result(
+                    template_file.getvalue(),
                     file_type,
                     st.session_state.footer_data,
                     footer_text,
                     client_logo_path
                 )
+                result.file_name = file_name
                 
-                # Vérifier si le fichier a été modifié
-                if success and os.path.exists(output_path):
-                    # Vérifier que le fichier de sortie est différent du fichier d'entrée
-                    with open(temp_path, "rb") as f1, open(output_path, "rb") as f2:
-                        if f1.read() != f2.read():
-                            rapport.append(f"✓ Succès : {file_name}")
-                            processed_files.append(file_name)
-                            details_container.success(f"✅ {file_name} : Traité avec succès")
-                        else:
-                            error_msg = f"❌ Échec : Le fichier n'a pas été modifié"
-                            rapport.append(error_msg)
-                            processing_errors.append(error_msg)
-                            details_container.warning(f"⚠️ {file_name} : Non modifié")
+                # Le moteur indique ce qu'il a modifié : pas besoin de comparer les fichiers
+                if result.modified:
+                    rapport.append(f"✓ Succès : {file_name}")
+                    processed_files[file_name] = output_data
+                    details_container.success(f"✅ {file_name} : Traité avec succès")
                 else:
-                    error_msg = f"❌ Échec : Erreur lors du traitement"
+                    error_msg = f"❌ Échec : Le fichier n'a pas été modifié"
                     rapport.append(error_msg)
                     processing_errors.append(error_msg)
-                    details_container.error(f"❌ {file_name} : Erreur de traitement")
+                    details_container.warning(f"⚠️ {file_name} : Non modifié")
+                rapport.extend(result.report_lines())
             except Exception as e:
                 error_msg = f"❌ Échec : {str(e)}"
                 rapport.append(error_msg)
                 processing_errors.append(error_msg)
                 details_container.error(f"❌ {file_name} : {str(e)}")
-            
-            # Nettoyer le fichier temporaire
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
         
         # Liste pour suivre les erreurs de ZIP
         zip_errors = []
@@ -227,39 +300,25 @@ def generate_client_documents(uploaded_templates, uploaded_logo):
         # Mettre à jour la progression - création du ZIP
         update_progress("Création du fichier ZIP")
         
-        # Créer le ZIP
-        zip_path = os.path.join(client_folder, "documents_client.zip")
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            # Ajouter les documents traités
-            for file_name in processed_files:
-                file_path = os.path.join(client_folder, file_name)
-                if os.path.exists(file_path):
-                    zipf.write(file_path, os.path.join("documents", file_name))
-                    details_container.info(f"📦 {file_name} ajouté au ZIP")
-                else:
-                    error_msg = f"❌ Erreur : {file_name} n'a pas été trouvé"
-                    details_container.error(error_msg)
-                    zip_errors.append(error_msg)
-            
-            # Ajouter toutes les erreurs au rapport
-            for error in zip_errors:
-                rapport.append(f"\n{error}")
-            
-            # Sauvegarder le rapport final
-            rapport_path = os.path.join(client_folder, "rapport_traitement.txt")
-            with open(rapport_path, "w", encoding="utf-8") as f:
-                f.write("\n".join(rapport))
-            
-            # Ajouter le rapport au ZIP (une seule fois)
-            zipf.write(rapport_path, "rapport_traitement.txt")
-            details_container.info("📄 Rapport ajouté au ZIP")
+        # Préparer les entrées du ZIP
+        zip_entries = []
+        for file_name, output_data in processed_files.items():
+            zip_entries.append((os.path.join("documents", file_name), output_data))
+            details_container.info(f"📦 {file_name} ajouté au ZIP")
+        
+        # Ajouter toutes les erreurs au rapport
+        for error in zip_errors:
+            rapport.append(f"\n{error}")
+        
+        # Ajouter le rapport au ZIP (une seule fois)
+        zip_entries.append(("rapport_traitement.txt", "\n".join(rapport).encode("utf-8")))
+        details_container.info("📄 Rapport ajouté au ZIP")
         
         # Mettre à jour la progression - finalisation
         update_progress("Finalisation")
         
-        # Lire le contenu du ZIP
-        with open(zip_path, "rb") as f:
-            zip_data = f.read()
+        # Construire le ZIP en flux, directement en mémoire pour le bouton de téléchargement
+        zip_data = b"".join(iter_zip_stream(zip_entries))
         
         # Nettoyer les fichiers temporaires
         shutil.rmtree(client_folder)
@@ -292,155 +351,86 @@ def generate_client_documents(uploaded_templates, uploaded_logo):
         if os.path.exists(client_folder):
             shutil.rmtree(client_folder)
 
-def setup_database():
-    """Initialise la base de données SQLite pour stocker les clients"""
-    # Créer un dossier pour la base de données
-    db_folder = os.path.join(SCRIPT_DIR, "database")
-    os.makedirs(db_folder, exist_ok=True)
-    
-    # Chemin vers le fichier de la base de données
-    db_path = os.path.join(db_folder, "clients.db")
-    
-    # Connexion à la base de données
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    # Création de la table clients si elle n'existe pas
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS clients (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT NOT NULL,
-        data TEXT NOT NULL,
-        creation_date TEXT,
-        logo_path TEXT
-    )
-    ''')
-    
-    conn.commit()
-    conn.close()
-    
-    return db_path
-
-def save_client(name, data, logo_file=None):
-    """Sauvegarde un client dans la base de données"""
-    db_path = os.path.join(SCRIPT_DIR, "database", "clients.db")
-    
-    # Sauvegarder le logo si fourni
-    logo_path = None
-    if logo_file:
-        logo_folder = os.path.join(SCRIPT_DIR, "database", "logos")
-        os.makedirs(logo_folder, exist_ok=True)
-        logo_path = os.path.join(logo_folder, f"{name.replace(' ', '_')}_logo.png")
-        with open(logo_path, "wb") as f:
-            f.write(logo_file.getvalue())
-    
-    # Convertir les données en JSON
-    data_json = json.dumps(data)
-    
-    # Connexion à la base de données
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+def generate_bulk_documents(uploaded_templates, clients, workspace):
+    """Génère les templates pour chacun des clients sélectionnés, en parallèle"""
+    if not uploaded_templates or not clients:
+        st.error("⚠️ Veuillez sélectionner des clients et télécharger les templates")
+        return
     
-    # Vérifier si le client existe déjà
-    cursor.execute("SELECT id FROM clients WHERE name = ?", (name,))
-    result = cursor.fetchone()
+    try:
+        # Templates, puis une copie traitée de chaque template par client
+        workspace.ensure_space(sum(template_file.size for template_file in uploaded_templates) * (len(clients) + 1))
+    except QuotaExceededError as e:
+        st.error(f"❌ {str(e)}")
+        return
     
-    if result:
-        # Mettre à jour le client existant
-        cursor.execute(
-            "UPDATE clients SET data = ?, logo_path = ? WHERE name = ?",
-            (data_json, logo_path, name)
-        )
-        client_id = result[0]
-    else:
-        # Créer un nouveau client
-        cursor.execute(
-            "INSERT INTO clients (name, data, creation_date, logo_path) VALUES (?, ?, ?, ?)",
-            (name, data_json, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), logo_path)
+    work_folder = workspace.make_temp_folder("bulk_")
+    try:
+        status_container = st.empty()
+        status_container.info("🔄 Génération des documents pour tous les clients...")
+        progress_bar = st.progress(0)
+        
+        # Sauvegarder les templates une seule fois pour tous les clients
+        templates_folder = os.path.join(work_folder, "templates")
+        os.makedirs(templates_folder, exist_ok=True)
+        template_paths = []
+        for template_file in uploaded_templates:
+            if os.path.splitext(template_file.name)[1].lower() not in SUPPORTED_EXTENSIONS:
+                continue
+            template_paths.append(workspace.write_file(templates_folder, template_file.name, template_file.getvalue()))
+        
+        # Préparer les données de chaque client (pied de page et logo)
+        jobs = []
+        for client in clients:
+            jobs.append({
+                "name": client["name"],
+                "data": client["data"],
+                "footer_text": generate_footer_text(defaultdict(str, client["data"])),
+                "logo_path": client["logo_path"]
+            })
+        
+        output_folder = os.path.join(work_folder, "clients")
+        total = len(jobs) * len(template_paths)
+        rapport = ["=== Rapport de génération en masse ===\n"]
+        rapport.append(f"Date : {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        rapport.append(f"Clients : {len(jobs)} - Templates : {len(template_paths)}\n")
+        generated = []
+        errors = 0
+        
+        for index, (client_name, relative_path, success) in enumerate(
+            generate_for_clients(template_paths, jobs, output_folder)
+        ):
+            if success:
+                generated.append(relative_path)
+                rapport.append(f"✓ {client_name} : {os.path.basename(relative_path)}")
+            else:
+                errors += 1
+                rapport.append(f"❌ {client_name} : {os.path.basename(relative_path)}")
+            progress_bar.progress((index + 1) / total)
+        
+        # Une archive avec un dossier par client
+        zip_entries = [(relative_path, os.path.join(output_folder, relative_path)) for relative_path in sorted(generated)]
+        zip_entries.append(("rapport_traitement.txt", "\n".join(rapport).encode("utf-8")))
+        zip_data = b"".join(iter_zip_stream(zip_entries))
+        
+        progress_bar.empty()
+        if generated:
+            status_container.success(f"✅ {len(generated)} documents générés pour {len(jobs)} clients")
+        else:
+            status_container.error("❌ Aucun document n'a pu être généré")
+        if errors:
+            st.warning(f"⚠️ {errors} erreurs se sont produites pendant le traitement")
+        
+        st.download_button(
+            label="📥 Télécharger les documents de tous les clients",
+            data=zip_data,
+            file_name="documents_clients.zip",
+            mime="application/zip"
         )
-        client_id = cursor.lastrowid
-    
-    conn.commit()
-    conn.close()
-    
-    return client_id
-
-def get_all_clients():
-    """Récupère tous les clients de la base de données"""
-    db_path = os.path.join(SCRIPT_DIR, "database", "clients.db")
-    
-    # Connexion à la base de données
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    # Récupérer tous les clients
-    cursor.execute("SELECT id, name, data, creation_date, logo_path FROM clients ORDER BY name")
-    clients = cursor.fetchall()
-    
-    conn.close()
-    
-    # Convertir en liste de dictionnaires
-    clients_list = []
-    for client in clients:
-        client_dict = {
-            "id": client[0],
-            "name": client[1],
-            "data": json.loads(client[2]),
-            "creation_date": client[3],
-            "logo_path": client[4]
-        }
-        clients_list.append(client_dict)
-    
-    return clients_list
-
-def get_client_by_id(client_id):
-    """Récupère un client par son ID"""
-    db_path = os.path.join(SCRIPT_DIR, "database", "clients.db")
-    
-    # Connexion à la base de données
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    # Récupérer le client
-    cursor.execute("SELECT id, name, data, creation_date, logo_path FROM clients WHERE id = ?", (client_id,))
-    client = cursor.fetchone()
-    
-    conn.close()
-    
-    if client:
-        client_dict = {
-            "id": client[0],
-            "name": client[1],
-            "data": json.loads(client[2]),
-            "creation_date": client[3],
-            "logo_path": client[4]
-        }
-        return client_dict
-    
-    return None
-
-def delete_client(client_id):
-    """Supprime un client de la base de données"""
-    db_path = os.path.join(SCRIPT_DIR, "database", "clients.db")
-    
-    # Connexion à la base de données
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    # Récupérer le chemin du logo
-    cursor.execute("SELECT logo_path FROM clients WHERE id = ?", (client_id,))
-    result = cursor.fetchone()
-    
-    if result and result[0]:
-        logo_path = result[0]
-        if os.path.exists(logo_path):
-            os.remove(logo_path)
-    
-    # Supprimer le client
-    cursor.execute("DELETE FROM clients WHERE id = ?", (client_id,))
-    
-    conn.commit()
-    conn.close()
+    except Exception as e:
+        st.error(f"❌ Une erreur est survenue : {str(e)}")
+    finally:
+        shutil.rmtree(work_folder, ignore_errors=True)
 
 def load_client_data(client_id):
     """Charge les données d'un client dans st.session_state.footer_data"""
@@ -487,6 +477,7 @@ def reset_client_data():
 
 def main():
     init_session_state()
+    workspace = current_workspace()
     
     st.title("🏢 Management Solution - Gestionnaire de Documents")
     
@@ -506,27 +497,43 @@ def main():
                 help="Formats supportés : " + ", ".join(SUPPORTED_EXTENSIONS.keys())
             )
             
+            new_files = [uploaded_file for uploaded_file in (uploaded_files or [])
+                         if uploaded_file.name not in st.session_state.processed_files]
+            try:
+                # Place nécessaire dans l'espace de la session : chaque document et sa sortie
+                workspace.ensure_space(2 * sum(uploaded_file.size for uploaded_file in new_files))
+            except QuotaExceededError as e:
+                st.error(f"❌ {str(e)}")
+                uploaded_files = None
+            
             if uploaded_files:
-                setup_folders()  # Assure que les dossiers nécessaires existent
-                
                 progress_text = "Traitement des documents en cours..."
                 progress_bar = st.progress(0)
                 
-                for index, uploaded_file in enumerate(uploaded_files):
-                    if uploaded_file.name not in st.session_state.processed_files:
-                        # Sauvegarde temporaire du fichier
-                        input_path = os.path.join(INPUT_FOLDER, uploaded_file.name)
-                        with open(input_path, "wb") as f:
-                            f.write(uploaded_file.getbuffer())
-                        
-                        # Traitement du fichier
-                        output_path = os.path.join(OUTPUT_FOLDER, uploaded_file.name)
-                        file_type = Path(uploaded_file.name).suffix
-                        
-                        if process_file(input_path, output_path, file_type, st.session_state.footer_text):
-                            st.session_state.processed_files.append(uploaded_file.name)
-                    
-                    progress_bar.progress((index + 1) / len(uploaded_files))
+                # Sauvegarde des nouveaux fichiers avant leur traitement en parallèle
+                jobs = []
+                for uploaded_file in new_files:
+                    input_path = workspace.write_file(workspace.input_folder, uploaded_file.name, uploaded_file.getbuffer())
+                    output_path = os.path.join(workspace.output_folder, uploaded_file.name)
+                    file_type = Path(uploaded_file.name).suffix
+                    jobs.append((input_path, output_path, file_type, st.session_state.footer_text, workspace.logo_path))
+                
+                already_done = len(uploaded_files) - len(jobs)
+                succeeded = set()
+                for index, (job, success) in enumerate(process_files(jobs)):
+                    if success:
+                        succeeded.add(os.path.basename(job[0]))
+                    progress_bar.progress((already_done + index + 1) / len(uploaded_files))
+                progress_bar.progress(1.0)
+                
+                # Conserver l'ordre de téléversement dans la liste des documents traités
+                for uploaded_file in uploaded_files:
+                    if uploaded_file.name in succeeded:
+                        st.session_state.processed_files.append(uploaded_file.name)
+                
+                # Versions PDF des nouveaux documents
+                convert_documents_to_pdf([uploaded_file.name for uploaded_file in uploaded_files
+                                          if uploaded_file.name in succeeded], workspace)
                 
                 st.success(f"✅ {len(uploaded_files)} documents traités avec succès!")
 
@@ -537,54 +544,61 @@ def main():
             st.write("##### Logo")
             new_logo = st.file_uploader("Changer le logo", type=['png', 'jpg', 'jpeg'])
             if new_logo:
-                with open(LOGO_PATH, "wb") as f:
-                    f.write(new_logo.getbuffer())
-                st.success("✅ Logo mis à jour!")
-                st.session_state.should_reprocess = True
+                # Logo propre à la session ; le fichier reste dans le champ à chaque réexécution,
+                # seul un logo différent déclenche la mise à jour des documents
+                try:
+                    if workspace.save_logo(new_logo.getvalue()):
+                        st.success("✅ Logo mis à jour!")
+                        st.session_state.should_reprocess = True
+                except QuotaExceededError as e:
+                    st.error(f"❌ {str(e)}")
             
             # Configuration du pied de page
             st.write("##### Pied de page")
             st.write("Remplissez les informations ci-dessous pour générer le pied de page")
             
-            # Création de deux colonnes pour le formulaire
-            footer_col1, footer_col2 = st.columns(2)
-            
-            with footer_col1:
-                st.session_state.footer_data['raison_socialOF'] = st.text_input("Raison sociale", st.session_state.footer_data['raison_socialOF'], key="config_raison_social")
-                st.session_state.footer_data['StatuOF'] = st.text_input("Statut juridique", st.session_state.footer_data['StatuOF'], key="config_statut")
-                st.session_state.footer_data['capitalOF'] = st.text_input("Capital (EUR)", st.session_state.footer_data['capitalOF'], key="config_capital")
-                st.session_state.footer_data['AdresseOF'] = st.text_input("Adresse", st.session_state.footer_data['AdresseOF'], key="config_adresse")
-                st.session_state.footer_data['CodepostaleOF'] = st.text_input("Code postal", st.session_state.footer_data['CodepostaleOF'], key="config_codepostal")
-                st.session_state.footer_data['VilleOF'] = st.text_input("Ville", st.session_state.footer_data['VilleOF'], key="config_ville")
-                st.session_state.footer_data['PaysOF'] = st.text_input("Pays", st.session_state.footer_data['PaysOF'], key="config_pays")
-                st.session_state.footer_data['TéléphoneOF'] = st.text_input("Téléphone", st.session_state.footer_data['TéléphoneOF'], key="config_telephone")
-            
-            with footer_col2:
-                st.session_state.footer_data['MailOF'] = st.text_input("Email", st.session_state.footer_data['MailOF'], key="config_email")
-                st.session_state.footer_data['siretOF'] = st.text_input("N° SIRET", st.session_state.footer_data['siretOF'], key="config_siret")
-                st.session_state.footer_data['RCSOF'] = st.text_input("RCS", st.session_state.footer_data['RCSOF'], key="config_rcs")
-                st.session_state.footer_data['APEOF'] = st.text_input("Code APE", st.session_state.footer_data['APEOF'], key="config_ape")
-                st.session_state.footer_data['TVAOF'] = st.text_input("N° TVA", st.session_state.footer_data['TVAOF'], key="config_tva")
-                st.session_state.footer_data['NDAOF'] = st.text_input("N° NDA", st.session_state.footer_data['NDAOF'], key="config_nda")
-                st.session_state.footer_data['RégiondrieetsOF'] = st.text_input("Région DRIEETS", st.session_state.footer_data['RégiondrieetsOF'], key="config_region")
-                st.session_state.footer_data['DatemajdocOF'] = st.text_input("Date maj doc", st.session_state.footer_data['DatemajdocOF'], key="config_date")
+            # Formulaire : la saisie ne relance pas le script, seule la validation le fait
+            with st.form("footer_form", border=False):
+                # Création de deux colonnes pour le formulaire
+                footer_col1, footer_col2 = st.columns(2)
+                
+                with footer_col1:
+                    st.session_state.footer_data['raison_socialOF'] = st.text_input("Raison sociale", st.session_state.footer_data['raison_socialOF'], key="config_raison_social")
+                    st.session_state.footer_data['StatuOF'] = st.text_input("Statut juridique", st.session_state.footer_data['StatuOF'], key="config_statut")
+                    st.session_state.footer_data['capitalOF'] = st.text_input("Capital (EUR)", st.session_state.footer_data['capitalOF'], key="config_capital")
+                    st.session_state.footer_data['AdresseOF'] = st.text_input("Adresse", st.session_state.footer_data['AdresseOF'], key="config_adresse")
+                    st.session_state.footer_data['CodepostaleOF'] = st.text_input("Code postal", st.session_state.footer_data['CodepostaleOF'], key="config_codepostal")
+                    st.session_state.footer_data['VilleOF'] = st.text_input("Ville", st.session_state.footer_data['VilleOF'], key="config_ville")
+                    st.session_state.footer_data['PaysOF'] = st.text_input("Pays", st.session_state.footer_data['PaysOF'], key="config_pays")
+                    st.session_state.footer_data['TéléphoneOF'] = st.text_input("Téléphone", st.session_state.footer_data['TéléphoneOF'], key="config_telephone")
+                
+                with footer_col2:
+                    st.session_state.footer_data['MailOF'] = st.text_input("Email", st.session_state.footer_data['MailOF'], key="config_email")
+                    st.session_state.footer_data['siretOF'] = st.text_input("N° SIRET", st.session_state.footer_data['siretOF'], key="config_siret")
+                    st.session_state.footer_data['RCSOF'] = st.text_input("RCS", st.session_state.footer_data['RCSOF'], key="config_rcs")
+                    st.session_state.footer_data['APEOF'] = st.text_input("Code APE", st.session_state.footer_data['APEOF'], key="config_ape")
+                    st.session_state.footer_data['TVAOF'] = st.text_input("N° TVA", st.session_state.footer_data['TVAOF'], key="config_tva")
+                    st.session_state.footer_data['NDAOF'] = st.text_input("N° NDA", st.session_state.footer_data['NDAOF'], key="config_nda")
+                    st.session_state.footer_data['RégiondrieetsOF'] = st.text_input("Région DRIEETS", st.session_state.footer_data['RégiondrieetsOF'], key="config_region")
+                    st.session_state.footer_data['DatemajdocOF'] = st.text_input("Date maj doc", st.session_state.footer_data['DatemajdocOF'], key="config_date")
+                
+                # Bouton pour mettre à jour le pied de page
+                submitted = st.form_submit_button("Mettre à jour le pied de page")
             
-            # Aperçu du pied de page
+            # Aperçu du pied de page (valeurs validées)
             st.write("##### Aperçu du pied de page")
             preview_footer = generate_footer_text(st.session_state.footer_data)
             st.text_area("", preview_footer, height=150, disabled=True)
             
-            # Bouton pour mettre à jour le pied de page
-            if st.button("Mettre à jour le pied de page"):
+            if submitted:
+                # Pied de page propre à la session : footer.txt reste la valeur par défaut des nouvelles sessions
                 st.session_state.footer_text = preview_footer
-                with open(os.path.join(SCRIPT_DIR, "footer.txt"), "w", encoding='utf-8') as f:
-                    f.write(preview_footer)
                 st.success("✅ Pied de page mis à jour!")
                 st.session_state.should_reprocess = True
         
         # Retraitement des documents si nécessaire
         if st.session_state.should_reprocess:
-            reprocess_all_documents()
+            reprocess_all_documents(workspace)
         
         # Section des fichiers traités
         if st.session_state.processed_files:
@@ -594,23 +608,28 @@ def main():
             files_to_zip = {}
             for file in st.session_state.processed_files:
                 # Ajout du fichier original
-                output_path = os.path.join(OUTPUT_FOLDER, file)
+                output_path = os.path.join(workspace.output_folder, file)
                 if os.path.exists(output_path):
                     files_to_zip[output_path] = os.path.join("documents", file)
                 
                 # Ajout de la version PDF si c'est un fichier docx
                 if file.endswith('.docx'):
-                    pdf_path = os.path.join(PDF_OUTPUT_FOLDER, file.rsplit('.', 1)[0] + '.pdf')
+                    pdf_path = os.path.join(workspace.pdf_folder, file.rsplit('.', 1)[0] + '.pdf')
                     if os.path.exists(pdf_path):
                         files_to_zip[pdf_path] = os.path.join("pdf", file.rsplit('.', 1)[0] + '.pdf')
             
             if files_to_zip:
-                zip_buffer = create_zip_buffer(files_to_zip)
+                # Archive gardée dans la session selon l'empreinte des fichiers : pas de recompression à chaque réexécution
+                entries = []
+                for file_path, zip_path in files_to_zip.items():
+                    signature = file_signature(file_path)
+                    if signature:
+                        entries.append((zip_path, *signature))
                 col_download_all = st.columns([6, 2])[1]
                 with col_download_all:
                     st.download_button(
                         label="📦 Tout télécharger",
-                        data=zip_buffer,
+                        data=zip_payload(tuple(entries)),
                         file_name="documents_traites.zip",
                         mime="application/zip",
                         help="Télécharger tous les documents et leurs versions PDF"
@@ -622,33 +641,32 @@ def main():
                 with col1:
                     st.write(f"📄 {file}")
                 with col2:
-                    output_path = os.path.join(OUTPUT_FOLDER, file)
-                    if os.path.exists(output_path):
-                        with open(output_path, "rb") as f:
-                            st.download_button(
-                                label="Télécharger",
-                                data=f,
-                                file_name=file,
-                                mime="application/octet-stream"
-                            )
+                    signature = file_signature(os.path.join(workspace.output_folder, file))
+                    if signature:
+                        st.download_button(
+                            label="Télécharger",
+                            data=file_payload(*signature),
+                            file_name=file,
+                            mime="application/octet-stream"
+                        )
                 with col3:
                     # Affichage du bouton PDF uniquement pour les fichiers docx
                     if file.endswith('.docx'):
-                        pdf_path = os.path.join(PDF_OUTPUT_FOLDER, file.rsplit('.', 1)[0] + '.pdf')
-                        if os.path.exists(pdf_path):
-                            with open(pdf_path, "rb") as f:
-                                st.download_button(
-                                    label="PDF",
-                                    data=f,
-                                    file_name=file.rsplit('.', 1)[0] + '.pdf',
-                                    mime="application/pdf"
-                                )
+                        signature = file_signature(os.path.join(workspace.pdf_folder, file.rsplit('.', 1)[0] + '.pdf'))
+                        if signature:
+                            st.download_button(
+                                label="PDF",
+                                data=file_payload(*signature),
+                                file_name=file.rsplit('.', 1)[0] + '.pdf',
+                                mime="application/pdf"
+                            )
 
     with tab2:
         st.subheader("👤 Création d'un nouveau client")
         
-        # Sélection d'un client existant
-        clients = get_all_clients()
+        # Sélection d'un client existant (recherche côté base, une page de résultats)
+        client_search = st.text_input("Rechercher un client (nom, ville, SIRET...)", key="client_search")
+        clients = list_clients(client_search)
         client_names = ["Nouveau client"] + [client["name"] for client in clients]
         
         selected_client_name = st.selectbox(
@@ -656,6 +674,9 @@ def main():
             client_names,
             index=0
         )
+        matching_clients = count_clients(client_search)
+        if matching_clients > len(clients):
+            st.caption(f"{len(clients)} clients affichés sur {matching_clients} : précisez la recherche")
         
         # Si un client existant est sélectionné, charger ses données
         if selected_client_name != "Nouveau client":
@@ -753,7 +774,7 @@ def main():
         # Bouton pour générer les documents
         if st.button("Générer les documents avec les informations client"):
             if uploaded_templates:
-                generate_client_documents(uploaded_templates, logo_to_use)
+                generate_client_documents(uploaded_templates, logo_to_use, workspace)
             else:
                 st.warning("Veuillez d'abord téléverser des documents templates.")
         
@@ -784,21 +805,27 @@ def main():
                 st.success("✅ Les champs ont été réinitialisés. Allez dans l'onglet 'Création de client' pour continuer.")
                 st.balloons()
         
-        # Récupérer tous les clients
-        clients = get_all_clients()
+        # Récupérer une page de clients, filtrée par la recherche
+        list_search = st.text_input("Rechercher un client (nom, ville, SIRET...)", key="client_list_search")
+        total_clients = count_clients(list_search)
+        page_count = max(1, -(-total_clients // CLIENT_PAGE_SIZE))
+        page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1,
+                               key="client_list_page") if page_count > 1 else 1
+        clients = list_clients(list_search, page - 1)
         
         if not clients:
-            st.info("Aucun client n'a été créé pour l'instant.")
+            st.info("Aucun client n'a été créé pour l'instant." if not list_search else "Aucun client ne correspond à la recherche.")
         else:
+            st.caption(f"{total_clients} clients – page {page} sur {page_count}")
             # Créer un DataFrame pour afficher les clients
             clients_df = []
             for client in clients:
                 clients_df.append({
                     "ID": client["id"],
                     "Nom": client["name"],
-                    "Raison sociale": client["data"].get("raison_socialOF", ""),
+                    "Raison sociale": client["raison_sociale"],
                     "Date de création": client["creation_date"],
-                    "Logo": "Oui" if client["logo_path"] else "Non"
+                    "Logo": "Oui" if client["has_logo"] else "Non"
                 })
             
             df = pd.DataFrame(clients_df)
@@ -867,6 +894,26 @@ def main():
                         st.button("☢️ Oui, supprimer", on_click=confirm_delete, key="confirm_delete_btn")
                     with col_cancel:
                         st.button("❌ Annuler", on_click=cancel_delete, key="cancel_delete_btn")
+            
+            # Génération des templates pour plusieurs clients à la fois
+            st.write("##### 📦 Génération en masse")
+            all_clients = st.checkbox("Tous les clients", value=False, key="bulk_all_clients")
+            # Les clients choisis sur les autres pages restent sélectionnés
+            selected_names = st.multiselect(
+                "Clients à traiter",
+                sorted({client["name"] for client in clients} | set(st.session_state.get("bulk_clients", []))),
+                disabled=all_clients,
+                key="bulk_clients"
+            )
+            bulk_templates = st.file_uploader(
+                "Déposez les templates à générer pour chaque client",
+                accept_multiple_files=True,
+                type=list(SUPPORTED_EXTENSIONS.keys()),
+                key="bulk_templates"
+            )
+            if st.button("Générer les documents pour les clients sélectionnés"):
+                bulk_clients = get_all_clients() if all_clients else get_clients_by_names(selected_names)
+                generate_bulk_documents(bulk_templates, bulk_clients, workspace)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,350 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+# Emplacement de la base de données des clients et de leurs logos
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DATABASE_FOLDER = os.path.join(SCRIPT_DIR, "database")
+DATABASE_PATH = os.path.join(DATABASE_FOLDER, "clients.db")
+LOGO_FOLDER = os.path.join(DATABASE_FOLDER, "logos")
+
+# Attente maximale (ms) lorsqu'une autre session écrit dans la base
+BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# Connexion partagée par le processus (les sessions Streamlit sont des threads du même processus)
+_connection = None
+_connection_pid = None
+_lock = threading.RLock()
+
+# Nombre de clients par page dans les listes et les listes déroulantes
+CLIENT_PAGE_SIZE = int(os.environ.get("CLIENT_PAGE_SIZE", "50"))
+
+# Résultats des lectures en mémoire, invalidés à chaque écriture ; data_version détecte
+# les écritures faites par d'autres processus
+QUERY_CACHE_SIZE = 128
+_query_cache = {}
+_cache_data_version = None
+
+# Recherche plein texte disponible (SQLite compilé avec FTS5)
+_fts_enabled = False
+# Connexion pour laquelle le schéma a déjà été vérifié (une fois par processus)
+_schema_ready_for = None
+
+CLIENT_COLUMNS = "id, name, data, creation_date, logo_path"
+# Colonnes des listes : le JSON des données n'est ni lu ni décodé
+SUMMARY_COLUMNS = "id, name, raison_sociale, creation_date, logo_path IS NOT NULL"
+
+# Version du schéma (PRAGMA user_version) ; chaque migration porte le schéma à la version suivante
+SCHEMA_VERSION = 2
+
+
+def get_connection():
+    """Retourne la connexion du processus, ouverte au premier appel en mode WAL"""
+    global _connection, _connection_pid
+    with _lock:
+        # Une connexion ne doit pas être réutilisée dans un processus enfant
+        if _connection is None or _connection_pid != os.getpid():
+            os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
+            connection = sqlite3.connect(DATABASE_PATH, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+            connection.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+            # Lectures concurrentes pendant les écritures
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            _connection = connection
+            _connection_pid = os.getpid()
+        return _connection
+
+
+def close_connection():
+    """Ferme la connexion du processus (elle sera rouverte au prochain accès)"""
+    global _connection, _connection_pid
+    with _lock:
+        if _connection is not None and _connection_pid == os.getpid():
+            _connection.close()
+        _connection = None
+        _connection_pid = None
+        invalidate_cache()
+
+
+def invalidate_cache():
+    """Oublie les lectures gardées en mémoire"""
+    global _cache_data_version
+    with _lock:
+        _query_cache.clear()
+        _cache_data_version = None
+
+
+def _data_version(connection):
+    return connection.execute("PRAGMA data_version").fetchone()[0]
+
+
+def _cached(key, loader):
+    """Résultat d'une lecture, relu seulement si la base a changé depuis la dernière lecture"""
+    global _cache_data_version
+    with _lock:
+        connection = get_connection()
+        version = _data_version(connection)
+        if version != _cache_data_version:
+            _query_cache.clear()
+            _cache_data_version = version
+        if key not in _query_cache:
+            if len(_query_cache) >= QUERY_CACHE_SIZE:
+                _query_cache.clear()
+            _query_cache[key] = loader(connection)
+        return _query_cache[key]
+
+
+def _row_to_summary(row):
+    return {
+        "id": row[0],
+        "name": row[1],
+        "raison_sociale": row[2] or "",
+        "creation_date": row[3],
+        "has_logo": bool(row[4])
+    }
+
+
+def _row_to_client(row):
+    return {
+        "id": row[0],
+        "name": row[1],
+        "data": json.loads(row[2]),
+        "creation_date": row[3],
+        "logo_path": row[4]
+    }
+
+
+def setup_database():
+    """Initialise la base de données SQLite pour stocker les clients"""
+    global _fts_enabled, _schema_ready_for
+    with _lock:
+        connection = get_connection()
+        # Appelée à chaque exécution de la page : le schéma n'est vérifié qu'une fois
+        if _schema_ready_for is connection:
+            return DATABASE_PATH
+        with connection:
+            # Création de la table clients si elle n'existe pas
+            connection.execute('''
+            CREATE TABLE IF NOT EXISTS clients (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                data TEXT NOT NULL,
+                creation_date TEXT,
+                logo_path TEXT
+            )
+            ''')
+            _migrate(connection)
+        _fts_enabled = _setup_search_index(connection)
+        _schema_ready_for = connection
+        invalidate_cache()
+    return DATABASE_PATH
+
+
+def _migrate(connection):
+    """Applique les migrations du schéma non encore appliquées"""
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version < 1:
+        # Raison sociale projetée depuis le JSON (colonne générée, calculée par SQLite à la lecture)
+        columns = {row[1] for row in connection.execute("PRAGMA table_xinfo(clients)")}
+        if "raison_sociale" not in columns:
+            connection.execute(
+                "ALTER TABLE clients ADD COLUMN raison_sociale TEXT "
+                "GENERATED ALWAYS AS (json_extract(data, '$.raison_socialOF')) VIRTUAL"
+            )
+    if version < 2:
+        # Un seul client par nom : les doublons éventuels sont renommés avant de créer l'index
+        _rename_duplicate_clients(connection)
+        connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_clients_name ON clients (name)")
+    if version < SCHEMA_VERSION:
+        connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+def _rename_duplicate_clients(connection):
+    """Renomme « nom (2) », « nom (3) »... les clients portant le même nom.
+    
+    La première ligne garde son nom (c'est elle que save_client mettait à jour) ;
+    aucune ligne ni aucun logo n'est supprimé.
+    """
+    names = {row[0] for row in connection.execute("SELECT name FROM clients")}
+    duplicates = connection.execute(
+        "SELECT id, name FROM clients WHERE id NOT IN (SELECT MIN(id) FROM clients GROUP BY name) ORDER BY id"
+    ).fetchall()
+    for client_id, name in duplicates:
+        suffix = 2
+        while f"{name} ({suffix})" in names:
+            suffix += 1
+        new_name = f"{name} ({suffix})"
+        names.add(new_name)
+        connection.execute("UPDATE clients SET name = ? WHERE id = ?", (new_name, client_id))
+        print(f"⚠️ Client en double « {name} » (id {client_id}) renommé « {new_name} »")
+
+
+def _setup_search_index(connection):
+    """Crée l'index plein texte (nom et champs du pied de page) et ses déclencheurs"""
+    footer_values = "(SELECT group_concat(value, ' ') FROM json_each({0}.data))"
+    try:
+        with connection:
+            exists = connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'clients_fts'"
+            ).fetchone()
+            connection.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS clients_fts "
+                "USING fts5(name, footer, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            connection.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS clients_fts_insert AFTER INSERT ON clients BEGIN
+                INSERT INTO clients_fts (rowid, name, footer) VALUES (new.id, new.name, {footer_values.format("new")});
+            END
+            ''')
+            connection.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS clients_fts_update AFTER UPDATE ON clients BEGIN
+                DELETE FROM clients_fts WHERE rowid = old.id;
+                INSERT INTO clients_fts (rowid, name, footer) VALUES (new.id, new.name, {footer_values.format("new")});
+            END
+            ''')
+            connection.execute('''
+            CREATE TRIGGER IF NOT EXISTS clients_fts_delete AFTER DELETE ON clients BEGIN
+                DELETE FROM clients_fts WHERE rowid = old.id;
+            END
+            ''')
+            if not exists:
+                # Indexation des clients existants
+                connection.execute(
+                    "INSERT INTO clients_fts (rowid, name, footer) "
+                    f"SELECT id, name, {footer_values.format('clients')} FROM clients"
+                )
+        return True
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ Recherche plein texte indisponible ({str(e)}), recherche simple utilisée")
+        return False
+
+
+def save_client(name, data, logo_file=None):
+    """Sauvegarde un client dans la base de données"""
+    # Sauvegarder le logo si fourni
+    logo_path = None
+    if logo_file:
+        os.makedirs(LOGO_FOLDER, exist_ok=True)
+        logo_path = os.path.join(LOGO_FOLDER, f"{name.replace(' ', '_')}_logo.png")
+        with open(logo_path, "wb") as f:
+            f.write(logo_file.getvalue())
+
+    # Convertir les données en JSON
+    data_json = json.dumps(data)
+
+    with _lock:
+        connection = get_connection()
+        with connection:
+            # Vérifier si le client existe déjà
+            result = connection.execute("SELECT id FROM clients WHERE name = ?", (name,)).fetchone()
+            if result:
+                # Mettre à jour le client existant
+                connection.execute(
+                    "UPDATE clients SET data = ?, logo_path = ? WHERE name = ?",
+                    (data_json, logo_path, name)
+                )
+                client_id = result[0]
+            else:
+                # Créer un nouveau client
+                cursor = connection.execute(
+                    "INSERT INTO clients (name, data, creation_date, logo_path) VALUES (?, ?, ?, ?)",
+                    (name, data_json, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), logo_path)
+                )
+                client_id = cursor.lastrowid
+        invalidate_cache()
+
+    return client_id
+
+
+def _copy_client(client):
+    # Les données d'un client sont modifiées par la session (formulaire) : le cache n'est jamais partagé
+    return dict(client, data=dict(client["data"]))
+
+
+def _search_filter(search):
+    """Condition SQL et paramètres d'une recherche (chaque mot est un préfixe)"""
+    words = re.findall(r"\w+", search or "")
+    if not words:
+        return "", ()
+    if _fts_enabled:
+        query = " AND ".join(f'"{word}"*' for word in words)
+        return "WHERE id IN (SELECT rowid FROM clients_fts WHERE clients_fts MATCH ?)", (query,)
+    conditions = " AND ".join("(name LIKE ? OR data LIKE ?)" for _ in words)
+    parameters = []
+    for word in words:
+        parameters.extend([f"%{word}%", f"%{word}%"])
+    return f"WHERE {conditions}", tuple(parameters)
+
+
+def get_all_clients():
+    """Récupère tous les clients de la base de données"""
+    def load(connection):
+        rows = connection.execute(f"SELECT {CLIENT_COLUMNS} FROM clients ORDER BY name").fetchall()
+        return [_row_to_client(row) for row in rows]
+    return [_copy_client(client) for client in _cached(("all",), load)]
+
+
+def count_clients(search=None):
+    """Nombre de clients correspondant à une recherche"""
+    condition, parameters = _search_filter(search)
+    return _cached(("count", search or ""), lambda connection: connection.execute(
+        f"SELECT COUNT(*) FROM clients {condition}", parameters
+    ).fetchone()[0])
+
+
+def list_clients(search=None, page=0, page_size=CLIENT_PAGE_SIZE):
+    """Une page de clients triés par nom, éventuellement filtrés par une recherche.
+    
+    Seules les colonnes des listes sont lues (id, name, raison_sociale, creation_date,
+    has_logo) ; le client complet est chargé avec get_client_by_id.
+    """
+    condition, parameters = _search_filter(search)
+
+    def load(connection):
+        rows = connection.execute(
+            f"SELECT {SUMMARY_COLUMNS} FROM clients {condition} ORDER BY name LIMIT ? OFFSET ?",
+            parameters + (page_size, page * page_size)
+        ).fetchall()
+        return [_row_to_summary(row) for row in rows]
+    return [dict(client) for client in _cached(("page", search or "", page, page_size), load)]
+
+
+def get_client_by_id(client_id):
+    """Récupère un client par son ID"""
+    client = _cached(("id", client_id), lambda connection: _fetch_client(connection, "id", client_id))
+    return _copy_client(client) if client else None
+
+
+def get_clients_by_names(names):
+    """Récupère les clients dont le nom figure dans la liste, triés par nom"""
+    clients = []
+    for name in sorted(set(names)):
+        client = _cached(("name", name), lambda connection: _fetch_client(connection, "name", name))
+        if client:
+            clients.append(_copy_client(client))
+    return clients
+
+
+def _fetch_client(connection, column, value):
+    row = connection.execute(f"SELECT {CLIENT_COLUMNS} FROM clients WHERE {column} = ?", (value,)).fetchone()
+    return _row_to_client(row) if row else None
+
+
+def delete_client(client_id):
+    """Supprime un client de la base de données"""
+    with _lock:
+        connection = get_connection()
+        with connection:
+            # Récupérer le chemin du logo
+            result = connection.execute("SELECT logo_path FROM clients WHERE id = ?", (client_id,)).fetchone()
+            if result and result[0]:
+                logo_path = result[0]
+                if os.path.exists(logo_path):
+                    os.remove(logo_path)
+
+            # Supprimer le client
+            connection.execute("DELETE FROM clients WHERE id = ?", (client_id,))
+        invalidate_cache()
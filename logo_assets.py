@@ -0,0 +1,106 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+# Largeur d'affichage du logo dans les documents (en-têtes Word, diapositives PowerPoint)
+LOGO_WIDTH_INCHES = 1.5
+# Résolution cible : au-delà, les pixels du logo ne sont plus visibles une fois imprimé
+LOGO_DPI = int(os.environ.get("LOGO_DPI", "300"))
+LOGO_MAX_WIDTH_PX = int(LOGO_WIDTH_INCHES * LOGO_DPI)
+
+# Préfixe des médias de logo intégrés dans les documents
+LOGO_MEDIA_PREFIX = "placeandreplace_logo_"
+
+# Formats intégrés tels quels ; les autres sont convertis en PNG
+EMBEDDABLE_FORMATS = {"PNG", "JPEG", "GIF"}
+
+LOGO_CACHE_SIZE = 8
+
+
+@dataclass(frozen=True)
+class LogoAsset:
+    """Logo décodé et réduit une seule fois, prêt à être intégré dans tous les formats"""
+    data: bytes
+    width: int
+    height: int
+    extension: str
+    digest: str
+
+    @property
+    def content_type(self):
+        return f"image/{self.extension}"
+
+    @property
+    def name(self):
+        """Nom du média, identique pour un même contenu : une seule partie partagée par document"""
+        return f"{LOGO_MEDIA_PREFIX}{self.digest[:12]}.{self.extension}"
+
+    def stream(self):
+        """Flux en mémoire sur les octets à intégrer (python-docx, python-pptx, openpyxl)"""
+        return io.BytesIO(self.data)
+
+
+def _build_asset(data, digest):
+    """Décode le logo et le réduit à la largeur cible si nécessaire"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image_format = (image.format or "PNG").upper()
+        width, height = image.size
+        if width <= LOGO_MAX_WIDTH_PX and image_format in EMBEDDABLE_FORMATS:
+            # Déjà à la bonne taille : les octets d'origine sont intégrés sans réencodage
+            output_format = image_format
+        else:
+            if width > LOGO_MAX_WIDTH_PX:
+                height = max(1, round(height * LOGO_MAX_WIDTH_PX / width))
+                width = LOGO_MAX_WIDTH_PX
+            output_format = "JPEG" if image_format == "JPEG" else "PNG"
+            if output_format == "JPEG":
+                resized = image.convert("RGB").resize((width, height), Image.LANCZOS)
+            else:
+                resized = image.convert("RGBA").resize((width, height), Image.LANCZOS)
+            buffer = io.BytesIO()
+            resized.save(buffer, format=output_format, **({"quality": 90} if output_format == "JPEG" else {}))
+            data = buffer.getvalue()
+    extension = "jpeg" if output_format == "JPEG" else output_format.lower()
+    return LogoAsset(data=data, width=width, height=height, extension=extension, digest=digest)
+
+
+# Logos récemment utilisés, par empreinte de contenu ; les fichiers déjà lus sont
+# reconnus par leur date de modification et leur taille, sans être relus
+_assets = OrderedDict()
+_file_digests = {}
+_assets_lock = threading.Lock()
+
+
+def get_logo_asset(logo_path):
+    """Retourne le logo prêt à intégrer, depuis le cache si le même contenu a déjà été préparé"""
+    stat = os.stat(logo_path)
+    file_key = (os.path.abspath(logo_path), stat.st_mtime_ns, stat.st_size)
+    with _assets_lock:
+        digest = _file_digests.get(file_key)
+        asset = _assets.get(digest) if digest else None
+        if asset is not None:
+            _assets.move_to_end(digest)
+            return asset
+
+    with open(logo_path, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha256(data).hexdigest()
+    with _assets_lock:
+        asset = _assets.get(digest)
+    if asset is None:
+        asset = _build_asset(data, digest)
+
+    with _assets_lock:
+        _file_digests[file_key] = digest
+        _assets[digest] = asset
+        _assets.move_to_end(digest)
+        while len(_assets) > LOGO_CACHE_SIZE:
+            evicted, _ = _assets.popitem(last=False)
+            for key in [key for key, value in _file_digests.items() if value == evicted]:
+                del _file_digests[key]
+    return asset
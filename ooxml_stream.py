@@ -0,0 +1,909 @@
+import hashlib
+import io
+import os
+import posixpath
+import re
+import struct
+import threading
+import zipfile
+import xml.sax
+import xml.etree.ElementTree as ET
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from xml.sax.saxutils import escape
+
+from placeholders import PlaceholderReplacer
+from logo_assets import LOGO_MEDIA_PREFIX, get_logo_asset
+
+# Espaces de noms et types de relations OOXML utilisés par le moteur
+NS_W = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+NS_R = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_WP = "http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing"
+NS_A = "http://schemas.openxmlformats.org/drawingml/2006/main"
+NS_PIC = "http://schemas.openxmlformats.org/drawingml/2006/picture"
+NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+NS_CT = "http://schemas.openxmlformats.org/package/2006/content-types"
+
+RT_OFFICE_DOCUMENT = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"
+RT_HEADER = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/header"
+RT_FOOTER = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/footer"
+RT_IMAGE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+
+CT_HEADER = "application/vnd.openxmlformats-officedocument.wordprocessingml.header+xml"
+CT_FOOTER = "application/vnd.openxmlformats-officedocument.wordprocessingml.footer+xml"
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+# Identifiants fixes : une nouvelle exécution remplace proprement les éléments ajoutés précédemment
+LOGO_REL_ID = "rIdPlaceAndReplaceLogo"
+HEADER_REL_ID = "rIdPlaceAndReplaceHeader"
+FOOTER_REL_ID = "rIdPlaceAndReplaceFooter"
+
+# Largeur du logo dans les en-têtes (1,5 pouce, comme python-docx avec Inches(1.5))
+LOGO_WIDTH_EMU = 1371600
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# En-tête local d'une entrée ZIP (signature, versions, drapeaux, ..., longueurs du nom et du champ extra)
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+
+
+class UnsupportedPackageError(ValueError):
+    """Le document ne peut pas être traité par le moteur en flux"""
+
+
+def copy_raw_entry(source_zip, info, target_zip):
+    """Copie une entrée d'une archive ZIP dans une autre, sans la recompresser lorsque c'est possible"""
+    if RAW_COPY_SUPPORTED:
+        _copy_raw(source_zip, info, target_zip)
+    else:
+        _copy_recompressed(source_zip, info, target_zip)
+
+
+def _copy_recompressed(source_zip, info, target_zip):
+    """Copie une entrée par l'API publique de zipfile (décompression puis recompression)"""
+    copied = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    copied.compress_type = info.compress_type
+    copied.external_attr = info.external_attr
+    copied.create_system = info.create_system
+    # Taille connue à l'avance : zipfile choisit le format (ZIP64 ou non) de l'en-tête
+    copied.file_size = info.file_size
+    with source_zip.open(info) as source, target_zip.open(copied, "w") as target:
+        for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b""):
+            target.write(chunk)
+
+
+def _copy_raw(source_zip, info, target_zip):
+    """Copie une entrée sans la décompresser ni la recompresser.
+    
+    Écrit directement dans l'archive cible par les attributs internes de zipfile :
+    utilisée seulement si _raw_copy_supported a validé la version de Python.
+    """
+    source = source_zip.fp
+    source.seek(info.header_offset)
+    header = _LOCAL_HEADER.unpack(source.read(_LOCAL_HEADER.size))
+    if header[0] != b"PK\x03\x04":
+        raise UnsupportedPackageError(f"En-tête local invalide pour {info.filename}")
+    source.seek(header[10] + header[11], io.SEEK_CUR)
+
+    # Les tailles et le CRC sont écrits dans l'en-tête local : plus besoin de descripteur de données
+    copied = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    copied.compress_type = info.compress_type
+    copied.CRC = info.CRC
+    copied.compress_size = info.compress_size
+    copied.file_size = info.file_size
+    copied.external_attr = info.external_attr
+    copied.create_system = info.create_system
+
+    # Écriture directe dans l'archive cible (aucune poignée d'écriture ne doit être ouverte)
+    with target_zip._lock:
+        target = target_zip.fp
+        copied.header_offset = target.tell()
+        target.write(copied.FileHeader())
+        remaining = info.compress_size
+        while remaining > 0:
+            chunk = source.read(min(COPY_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise UnsupportedPackageError(f"Entrée tronquée : {info.filename}")
+            target.write(chunk)
+            remaining -= len(chunk)
+        target_zip.filelist.append(copied)
+        target_zip.NameToInfo[copied.filename] = copied
+        target_zip.start_dir = target.tell()
+
+
+def _raw_copy_supported():
+    """Vérifie une fois, sur une petite archive en mémoire, que la copie brute produit une archive valide"""
+    try:
+        data = b"<a/>" * 256
+        source = io.BytesIO()
+        with zipfile.ZipFile(source, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("a.xml", data)
+        target = io.BytesIO()
+        with zipfile.ZipFile(source) as zin, zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as zout:
+            _copy_raw(zin, zin.getinfo("a.xml"), zout)
+            zout.writestr("b.xml", b"<b/>")
+        with zipfile.ZipFile(target) as archive:
+            return (archive.testzip() is None and archive.read("a.xml") == data
+                    and archive.read("b.xml") == b"<b/>")
+    except Exception:
+        return False
+
+
+# Copie brute des entrées inchangées ; sinon recompression par l'API publique
+RAW_COPY_SUPPORTED = _raw_copy_supported()
+if not RAW_COPY_SUPPORTED:
+    print("⚠️ Copie brute des archives indisponible avec cette version de Python : entrées recompressées")
+
+
+class _XmlWriter:
+    """Écriture XML minimale en flux, avec balises vides abrégées"""
+
+    _ATTR_ENTITIES = {'"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#9;"}
+
+    def __init__(self, out):
+        self._out = out
+        self._pending = False
+
+    def _close_pending(self):
+        if self._pending:
+            self._out.write(">")
+            self._pending = False
+
+    def start(self, name, attrs):
+        self._close_pending()
+        parts = ["<", name]
+        for key, value in attrs.items():
+            parts.append(f' {key}="{escape(value, self._ATTR_ENTITIES)}"')
+        self._out.write("".join(parts))
+        self._pending = True
+
+    def end(self, name):
+        if self._pending:
+            self._out.write("/>")
+            self._pending = False
+        else:
+            self._out.write(f"</{name}>")
+
+    def chars(self, text):
+        if text:
+            self._close_pending()
+            self._out.write(escape(text, {"\r": "&#13;"}))
+
+    def raw(self, xml_text):
+        if xml_text:
+            self._close_pending()
+            self._out.write(xml_text)
+
+    def processing_instruction(self, target, data):
+        self._close_pending()
+        self._out.write(f"<?{target} {data}?>")
+
+
+class _WordPartFilter(xml.sax.handler.ContentHandler):
+    """Filtre SAX d'une partie Word (document, en-tête ou pied de page).
+
+    Les événements ne sont mis en mémoire qu'à l'échelle d'un paragraphe ou d'une section,
+    le reste du flux est réécrit au fil de l'eau.
+    """
+
+    def __init__(self, writer, replacer=None, clear_paragraphs=False, first_paragraph_xml=None,
+                 closing_xml=None, section_refs=None, part_name=None, placeholders=None,
+                 drop_last_paragraphs=0):
+        super().__init__()
+        self.writer = writer
+        self.replacer = replacer
+        self.clear_paragraphs = clear_paragraphs
+        self.first_paragraph_xml = first_paragraph_xml
+        self.closing_xml = closing_xml
+        self.section_refs = section_refs or {}
+        self.part_name = part_name
+        # Emplacements des variables : (partie, paragraphe, run, position, clé)
+        self.placeholders = placeholders
+        # Derniers paragraphes de premier niveau à retirer (ajoutés par un traitement précédent)
+        self.drop_last_paragraphs = drop_last_paragraphs
+        self._held = deque()
+        self.added_refs = set()
+        self.modified = False
+        self.root = None
+        self._section_seen = False
+        self._first_paragraph_done = False
+        self._paragraph_count = 0
+        self._depth = 0
+        self._buffer = None
+        self._buffer_depth = 0
+
+    # Événements SAX
+
+    def startElement(self, name, attrs):
+        if self._depth == 0:
+            self.root = name
+            if not name.startswith("w:"):
+                raise UnsupportedPackageError(f"Préfixe d'espace de noms inattendu : {name}")
+        event = ("start", name, dict(attrs.items()), self._depth)
+        if self._held and self._buffer is None and self._depth == 1 and name != "w:p":
+            # Un autre bloc suit : les paragraphes retenus ne sont pas les derniers
+            self._release_held()
+        if self._buffer is None and name in ("w:p", "w:sectPr"):
+            self._buffer = []
+            self._buffer_depth = self._depth
+        if self._buffer is not None:
+            self._buffer.append(event)
+        else:
+            self.writer.start(name, event[2])
+        self._depth += 1
+
+    def endElement(self, name):
+        self._depth -= 1
+        if self._depth == 0:
+            if self._held:
+                self._held.clear()
+                self.modified = True
+            self._write_closing()
+        if self._buffer is not None:
+            self._buffer.append(("end", name, self._depth))
+            if self._depth == self._buffer_depth:
+                self._flush()
+        else:
+            self.writer.end(name)
+
+    def characters(self, content):
+        if self._buffer is not None:
+            self._buffer.append(("chars", content))
+        elif self._held:
+            self._held[-1].append(("chars", content))
+        else:
+            self.writer.chars(content)
+
+    ignorableWhitespace = characters
+
+    def processingInstruction(self, target, data):
+        if self._buffer is not None:
+            self._buffer.append(("pi", target, data))
+        else:
+            self.writer.processing_instruction(target, data)
+
+    # Traitement des blocs mis en mémoire
+
+    def _write_closing(self):
+        """Ajoute le contenu de fin de partie (logo sans paragraphe existant, pied de page)"""
+        if self.first_paragraph_xml and not self._first_paragraph_done:
+            self.writer.raw(f"<w:p>{self.first_paragraph_xml}</w:p>")
+            self._first_paragraph_done = True
+            self.modified = True
+        if self.closing_xml:
+            self.writer.raw(self.closing_xml)
+            self.modified = True
+
+    def _flush(self):
+        events = self._buffer
+        self._buffer = None
+        numbers = {}
+        for index, event in enumerate(events):
+            if event[0] == "start" and event[1] == "w:p":
+                numbers[index] = self._paragraph_count
+                self._paragraph_count += 1
+        if self.section_refs and not self._section_seen:
+            self._inject_section_refs(events)
+        top_level_paragraph = events[0][1] == "w:p" and events[0][3] == 1
+        if self.clear_paragraphs and top_level_paragraph:
+            events = self._clear_paragraph(events)
+        elif self.replacer is not None:
+            self._replace_text(events, numbers)
+        if self.drop_last_paragraphs and top_level_paragraph:
+            self._held.append(events)
+            if len(self._held) > self.drop_last_paragraphs:
+                for event in self._held.popleft():
+                    self._emit(event)
+            return
+        for event in events:
+            self._emit(event)
+
+    def _release_held(self):
+        while self._held:
+            for event in self._held.popleft():
+                self._emit(event)
+
+    def _emit(self, event):
+        kind = event[0]
+        if kind == "start":
+            self.writer.start(event[1], event[2])
+        elif kind == "end":
+            self.writer.end(event[1])
+        elif kind == "chars":
+            self.writer.chars(event[1])
+        elif kind == "raw":
+            self.writer.raw(event[1])
+        else:
+            self.writer.processing_instruction(event[1], event[2])
+
+    def _inject_section_refs(self, events):
+        """Ajoute les références d'en-tête/pied de page manquantes à la première section du document"""
+        for index, event in enumerate(events):
+            if event[0] == "start" and event[1] == "w:sectPr":
+                break
+        else:
+            return
+        self._section_seen = True
+        depth = event[3]
+        present = set()
+        for child in events[index + 1:]:
+            if child[0] == "end" and child[2] == depth:
+                break
+            if child[0] == "start" and child[3] == depth + 1 and child[2].get("w:type", "default") == "default":
+                present.add(child[1])
+        missing = [name for name in ("w:headerReference", "w:footerReference")
+                   if name in self.section_refs and name not in present]
+        if missing:
+            events.insert(index + 1, ("raw", "".join(self.section_refs[name] for name in missing)))
+            self.added_refs.update(missing)
+            self.modified = True
+
+    def _clear_paragraph(self, events):
+        """Vide un paragraphe de premier niveau en conservant sa mise en forme (w:pPr)"""
+        kept = [events[0]]
+        inside_properties = False
+        for event in events[1:-1]:
+            if event[0] == "start" and event[1] == "w:pPr" and event[3] == 2:
+                inside_properties = True
+            if inside_properties:
+                kept.append(event)
+                if event[0] == "end" and event[1] == "w:pPr" and event[2] == 2:
+                    inside_properties = False
+        if self.first_paragraph_xml and not self._first_paragraph_done:
+            kept.append(("raw", self.first_paragraph_xml))
+            self._first_paragraph_done = True
+        kept.append(events[-1])
+        self.modified = True
+        return kept
+
+    def _replace_text(self, events, numbers):
+        """Remplace les variables de chaque paragraphe en respectant le découpage en runs"""
+        paragraphs = {}
+        stack = []
+        current = None
+        for index, event in enumerate(events):
+            kind = event[0]
+            if kind == "start":
+                if event[1] == "w:p":
+                    stack.append(index)
+                elif event[1] == "w:t" and stack:
+                    current = (index, [])
+                    paragraphs.setdefault(stack[-1], []).append(current)
+            elif kind == "end":
+                if event[1] == "w:p" and stack:
+                    stack.pop()
+                elif event[1] == "w:t":
+                    current = None
+            elif kind == "chars" and current is not None:
+                current[1].append(index)
+
+        for paragraph_index, texts in paragraphs.items():
+            segments = ["".join(events[i][1] for i in chars) for _, chars in texts]
+            found = [] if self.placeholders is not None else None
+            replaced = self.replacer.replace_segments(segments, found)
+            if replaced is None:
+                continue
+            self.modified = True
+            if found:
+                paragraph = numbers[paragraph_index]
+                self.placeholders.extend((self.part_name, paragraph, run, offset, key) for run, offset, key in found)
+            for (start_index, chars), old, new in zip(texts, segments, replaced):
+                if new == old:
+                    continue
+                events[chars[0]] = ("chars", new)
+                for i in chars[1:]:
+                    events[i] = ("chars", "")
+                start = events[start_index]
+                attrs = dict(start[2])
+                attrs["xml:space"] = "preserve"
+                events[start_index] = ("start", start[1], attrs, start[3])
+
+
+def _run_text_xml(text):
+    """Contenu d'un run pour un texte pouvant contenir des retours à la ligne et des tabulations"""
+    parts = []
+    for line_index, line in enumerate(text.replace("\r\n", "\n").replace("\r", "\n").split("\n")):
+        if line_index:
+            parts.append("<w:br/>")
+        for tab_index, chunk in enumerate(line.split("\t")):
+            if tab_index:
+                parts.append("<w:tab/>")
+            if chunk:
+                parts.append(f'<w:t xml:space="preserve">{escape(chunk)}</w:t>')
+    return "".join(parts)
+
+
+def footer_paragraphs_xml(footer_text):
+    """Paragraphes ajoutés en fin de pied de page : deux lignes d'espacement, le texte dans la dernière"""
+    return f"<w:p/><w:p><w:r>{_run_text_xml(footer_text)}</w:r></w:p>"
+
+
+def logo_run_xml(logo, rel_id=LOGO_REL_ID, shape_id=1):
+    """Run contenant l'image du logo, référencée par une relation de la partie"""
+    cx = LOGO_WIDTH_EMU
+    cy = int(round(cx * logo.height / logo.width))
+    return (
+        "<w:r><w:drawing>"
+        f'<wp:inline distT="0" distB="0" distL="0" distR="0" xmlns:wp="{NS_WP}" xmlns:a="{NS_A}" '
+        f'xmlns:pic="{NS_PIC}" xmlns:r="{NS_R}">'
+        f'<wp:extent cx="{cx}" cy="{cy}"/>'
+        f'<wp:docPr id="{shape_id}" name="Logo {shape_id}"/>'
+        '<wp:cNvGraphicFramePr><a:graphicFrameLocks noChangeAspect="1"/></wp:cNvGraphicFramePr>'
+        f'<a:graphic><a:graphicData uri="{NS_PIC}"><pic:pic>'
+        f'<pic:nvPicPr><pic:cNvPr id="0" name="{logo.name}"/><pic:cNvPicPr/></pic:nvPicPr>'
+        f'<pic:blipFill><a:blip r:embed="{rel_id}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+        f'<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+        '<a:prstGeom prst="rect"><a:avLst/></a:prstGeom></pic:spPr>'
+        "</pic:pic></a:graphicData></a:graphic></wp:inline></w:drawing></w:r>"
+    )
+
+
+def _rels_name(part_name):
+    """Nom de la partie de relations associée à une partie"""
+    directory, file_name = posixpath.split(part_name)
+    return posixpath.join(directory, "_rels", f"{file_name}.rels")
+
+
+def _resolve_target(part_name, target):
+    """Chemin absolu (dans l'archive) de la cible d'une relation"""
+    if target.startswith("/"):
+        return target[1:]
+    return posixpath.normpath(posixpath.join(posixpath.dirname(part_name), target))
+
+
+def _read_xml(zin, name):
+    with zin.open(name) as f:
+        return ET.parse(f).getroot()
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _serialize(root, namespace):
+    """Sérialise une partie à plat ([Content_Types].xml, relations) avec son espace de noms par défaut"""
+    parts = [XML_DECLARATION, f'<{_local_name(root.tag)} xmlns="{namespace}">']
+    for child in root:
+        attrs = "".join(f' {key}="{escape(value, {chr(34): "&quot;"})}"' for key, value in child.attrib.items())
+        parts.append(f"<{_local_name(child.tag)}{attrs}/>")
+    parts.append(f"</{_local_name(root.tag)}>")
+    return "".join(parts)
+
+
+def _new_entry(name, date_time=None):
+    info = zipfile.ZipInfo(name, date_time=date_time or (1980, 1, 1, 0, 0, 0))
+    info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+
+def _hole(kind, argument=""):
+    """Marqueur d'emplacement à compléter au rendu (caractères Unicode à usage privé)"""
+    return f"\ue000{kind}:{argument}\ue001"
+
+
+_HOLE_PATTERN = re.compile("\ue000(\\w+):([^\ue001]*)\ue001")
+
+
+def _split_holes(text):
+    """Découpe un texte en morceaux fixes et emplacements (type, argument)"""
+    pieces = []
+    position = 0
+    for match in _HOLE_PATTERN.finditer(text):
+        if match.start() > position:
+            pieces.append(text[position:match.start()])
+        pieces.append((match.group(1), match.group(2)))
+        position = match.end()
+    if position < len(text):
+        pieces.append(text[position:])
+    return pieces
+
+
+class _PlaceholderRecorder(PlaceholderReplacer):
+    """Remplace chaque variable par un emplacement numéroté au lieu de sa valeur"""
+
+    def __init__(self):
+        super().__init__({})
+        self.keys = []
+        self._indexes = {}
+
+    def lookup(self, key):
+        if key not in self._indexes:
+            self._indexes[key] = len(self.keys)
+            self.keys.append(key)
+        return _hole("value", self._indexes[key])
+
+
+def _filter_part(source, **filter_options):
+    """Passe une partie XML dans le filtre SAX et retourne le texte produit et le filtre"""
+    out = io.StringIO()
+    out.write(XML_DECLARATION)
+    handler = _WordPartFilter(_XmlWriter(out), **filter_options)
+    parser = xml.sax.make_parser()
+    parser.setContentHandler(handler)
+    parser.parse(source)
+    return out.getvalue(), handler
+
+
+def _main_document_part(zin):
+    for rel in _read_xml(zin, "_rels/.rels"):
+        if rel.get("Type") == RT_OFFICE_DOCUMENT:
+            return _resolve_target("", rel.get("Target"))
+    raise UnsupportedPackageError("Partie principale introuvable")
+
+
+def _next_part_name(names, directory, stem):
+    index = 1
+    while posixpath.join(directory, f"{stem}{index}.xml") in names:
+        index += 1
+    return posixpath.join(directory, f"{stem}{index}.xml")
+
+
+def _with_logo_relationship(rels_root, part_name, media_dir):
+    """Remplace la relation du logo d'une partie d'en-tête par celle du logo courant"""
+    if rels_root is None:
+        rels_root = ET.Element(f"{{{NS_PKG_REL}}}Relationships")
+    for rel in list(rels_root):
+        if rel.get("Id") == LOGO_REL_ID:
+            rels_root.remove(rel)
+    ET.SubElement(rels_root, f"{{{NS_PKG_REL}}}Relationship", {
+        "Id": LOGO_REL_ID,
+        "Type": RT_IMAGE,
+        "Target": posixpath.join(posixpath.relpath(media_dir, posixpath.dirname(part_name)), _hole("logo_name")),
+    })
+    return rels_root
+
+
+def _shape_id(part_name):
+    """Identifiant de forme propre à chaque partie d'en-tête"""
+    return 1000 + int(hashlib.sha1(part_name.encode("utf-8")).hexdigest()[:4], 16)
+
+
+def _add_relationship(rels_root, rel_id, rel_type, target):
+    for rel in list(rels_root):
+        if rel.get("Id") == rel_id:
+            rels_root.remove(rel)
+    ET.SubElement(rels_root, f"{{{NS_PKG_REL}}}Relationship", {"Id": rel_id, "Type": rel_type, "Target": target})
+
+
+def _content_types(zin, logo_extension, new_header, new_footer):
+    """Déclare le type du logo et des nouvelles parties dans [Content_Types].xml"""
+    root = _read_xml(zin, "[Content_Types].xml")
+    if logo_extension:
+        extensions = {
+            element.get("Extension", "").lower()
+            for element in root.findall(f"{{{NS_CT}}}Default")
+        }
+        if logo_extension not in extensions:
+            ET.SubElement(root, f"{{{NS_CT}}}Default", {
+                "Extension": logo_extension,
+                "ContentType": f"image/{logo_extension}",
+            })
+    for part_name, content_type in ((new_header, CT_HEADER), (new_footer, CT_FOOTER)):
+        if part_name:
+            ET.SubElement(root, f"{{{NS_CT}}}Override", {"PartName": f"/{part_name}", "ContentType": content_type})
+    return _serialize(root, NS_CT)
+
+
+@dataclass
+class DocxRenderPlan:
+    """Plan de rendu compilé d'un template .docx.
+
+    `entries` décrit l'archive de sortie dans l'ordre : entrées recopiées telles quelles
+    ("raw", nom), parties réécrites ("xml", nom, date, morceaux) dont les morceaux alternent
+    texte fixe et emplacements à compléter, et média du logo ("logo", dossier).
+    """
+    entries: list = field(default_factory=list)
+    keys: list = field(default_factory=list)
+    placeholders: list = field(default_factory=list)
+    headers: list = field(default_factory=list)
+    footers: list = field(default_factory=list)
+
+
+def compile_docx_plan(source, with_values=True, logo_extension=None, with_footer=False):
+    """Analyse un template .docx une seule fois et enregistre tout ce que le rendu doit compléter.
+
+    Les variables «clé», le logo des en-têtes et le texte des pieds de page sont remplacés
+    par des emplacements ; les parties sans emplacement ni modification sont recopiées
+    telles quelles au rendu.
+    """
+    recorder = _PlaceholderRecorder() if with_values else None
+    plan = DocxRenderPlan()
+
+    with zipfile.ZipFile(source) as zin:
+        names = set(zin.namelist())
+        main_part = _main_document_part(zin)
+        main_dir = posixpath.dirname(main_part)
+        main_rels = _rels_name(main_part)
+        if main_part not in names:
+            raise UnsupportedPackageError(f"Partie principale absente : {main_part}")
+
+        rels_root = _read_xml(zin, main_rels) if main_rels in names else ET.Element(f"{{{NS_PKG_REL}}}Relationships")
+        headers, footers = set(), set()
+        for rel in rels_root:
+            if rel.get("TargetMode") == "External":
+                continue
+            if rel.get("Type") == RT_HEADER:
+                headers.add(_resolve_target(main_part, rel.get("Target")))
+            elif rel.get("Type") == RT_FOOTER:
+                footers.add(_resolve_target(main_part, rel.get("Target")))
+
+        new_header = _next_part_name(names, main_dir, "header") if logo_extension else None
+        new_footer = _next_part_name(names, main_dir, "footer") if with_footer else None
+        section_refs = {}
+        if new_header:
+            section_refs["w:headerReference"] = (
+                f'<w:headerReference xmlns:r="{NS_R}" w:type="default" r:id="{HEADER_REL_ID}"/>'
+            )
+        if new_footer:
+            section_refs["w:footerReference"] = (
+                f'<w:footerReference xmlns:r="{NS_R}" w:type="default" r:id="{FOOTER_REL_ID}"/>'
+            )
+        media_dir = posixpath.join(main_dir, "media")
+
+        header_options = {
+            "replacer": recorder,
+            "clear_paragraphs": logo_extension is not None,
+            "placeholders": plan.placeholders,
+        }
+        footer_options = {
+            "replacer": recorder,
+            "clear_paragraphs": with_footer,
+            "closing_xml": _hole("footer") if with_footer else None,
+            "placeholders": plan.placeholders,
+        }
+
+        def add_part(name, date_time, text, handler):
+            if handler.modified or name not in names:
+                plan.entries.append(("xml", name, date_time, _split_holes(text)))
+            else:
+                plan.entries.append(("raw", name))
+
+        # 1. Partie principale : variables et références de la première section
+        main_info = zin.getinfo(main_part)
+        with zin.open(main_info) as f:
+            text, handler = _filter_part(f, replacer=recorder, section_refs=section_refs,
+                                         part_name=main_part, placeholders=plan.placeholders)
+        if handler.root != "w:document":
+            raise UnsupportedPackageError(f"Partie principale inattendue : {handler.root}")
+        add_part(main_part, main_info.date_time, text, handler)
+        if "w:headerReference" not in handler.added_refs:
+            new_header = None
+        if "w:footerReference" not in handler.added_refs:
+            new_footer = None
+        if new_header:
+            headers.add(new_header)
+        if new_footer:
+            footers.add(new_footer)
+        header_rels = {_rels_name(name): name for name in headers} if logo_extension else {}
+
+        # 2. Autres entrées, dans l'ordre d'origine
+        for info in zin.infolist():
+            name = info.filename
+            if name == main_part:
+                continue
+            if logo_extension and posixpath.basename(name).startswith(LOGO_MEDIA_PREFIX):
+                # Logo d'un traitement précédent, remplacé par le logo courant
+                continue
+            if name == "[Content_Types].xml" and (logo_extension or new_header or new_footer):
+                text = _content_types(zin, logo_extension, new_header, new_footer)
+                plan.entries.append(("xml", name, info.date_time, [text]))
+            elif name == main_rels and (new_header or new_footer):
+                if new_header:
+                    _add_relationship(rels_root, HEADER_REL_ID, RT_HEADER, posixpath.relpath(new_header, main_dir))
+                if new_footer:
+                    _add_relationship(rels_root, FOOTER_REL_ID, RT_FOOTER, posixpath.relpath(new_footer, main_dir))
+                plan.entries.append(("xml", name, info.date_time, [_serialize(rels_root, NS_PKG_REL)]))
+            elif name in headers and (logo_extension or recorder):
+                first_paragraph = _hole("logo_run", _shape_id(name)) if logo_extension else None
+                with zin.open(info) as f:
+                    text, handler = _filter_part(f, part_name=name, first_paragraph_xml=first_paragraph,
+                                                 **header_options)
+                add_part(name, info.date_time, text, handler)
+            elif name in footers and (with_footer or recorder):
+                with zin.open(info) as f:
+                    text, handler = _filter_part(f, part_name=name, **footer_options)
+                add_part(name, info.date_time, text, handler)
+            elif name in header_rels:
+                rels = _with_logo_relationship(_read_xml(zin, name), header_rels[name], media_dir)
+                plan.entries.append(("xml", name, info.date_time, _split_holes(_serialize(rels, NS_PKG_REL))))
+            else:
+                plan.entries.append(("raw", name))
+
+        # 3. Nouvelles parties : en-tête/pied de page de la première section, relations, logo
+        empty_part = '<w:{0} xmlns:w="' + NS_W + '" xmlns:r="' + NS_R + '"><w:p/></w:{0}>'
+        if new_header:
+            text, handler = _filter_part(io.StringIO(empty_part.format("hdr")), part_name=new_header,
+                                         first_paragraph_xml=_hole("logo_run", _shape_id(new_header)),
+                                         **header_options)
+            add_part(new_header, None, text, handler)
+        if new_footer:
+            text, handler = _filter_part(io.StringIO(empty_part.format("ftr")), part_name=new_footer,
+                                         **footer_options)
+            add_part(new_footer, None, text, handler)
+        for rels_name, part_name in header_rels.items():
+            if rels_name not in names:
+                rels = _with_logo_relationship(None, part_name, media_dir)
+                plan.entries.append(("xml", rels_name, None, _split_holes(_serialize(rels, NS_PKG_REL))))
+        if logo_extension:
+            plan.entries.append(("logo", media_dir))
+
+    plan.keys = recorder.keys if recorder else []
+    plan.headers = sorted(headers) if logo_extension else []
+    plan.footers = sorted(footers) if with_footer else []
+    return plan
+
+
+def refresh_docx_header_footer(source, target, footer_text=None, logo_path=None):
+    """Met à jour uniquement les en-têtes et pieds de page d'un document déjà produit.
+
+    La partie principale et les autres parties sont recopiées avec leurs octets compressés
+    d'origine ; seuls les en-têtes (logo), les pieds de page, leurs relations et le média
+    du logo sont réécrits. Les deux paragraphes ajoutés en fin de pied de page par le
+    traitement précédent sont remplacés, ce qui rend la mise à jour répétable.
+    """
+    logo = get_logo_asset(logo_path) if logo_path else None
+
+    def fill(text):
+        return "".join(piece if isinstance(piece, str) else _fill_hole(piece, {}, None, footer_text, logo)
+                       for piece in _split_holes(text))
+
+    with zipfile.ZipFile(source) as zin:
+        names = set(zin.namelist())
+        main_part = _main_document_part(zin)
+        main_rels = _rels_name(main_part)
+        media_dir = posixpath.join(posixpath.dirname(main_part), "media")
+        if main_rels not in names:
+            raise UnsupportedPackageError("Relations de la partie principale absentes")
+        headers, footers = set(), set()
+        for rel in _read_xml(zin, main_rels):
+            if rel.get("TargetMode") == "External":
+                continue
+            if rel.get("Type") == RT_HEADER:
+                headers.add(_resolve_target(main_part, rel.get("Target")))
+            elif rel.get("Type") == RT_FOOTER:
+                footers.add(_resolve_target(main_part, rel.get("Target")))
+        # Sans en-tête ou pied de page existant, il faudrait modifier la partie principale
+        if (logo and not headers) or (footer_text and not footers):
+            raise UnsupportedPackageError("Document sans en-tête ou pied de page à mettre à jour")
+        header_rels = {_rels_name(name): name for name in headers} if logo else {}
+
+        with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as zout:
+            def write_text(name, date_time, text):
+                with zout.open(_new_entry(name, date_time), "w") as raw:
+                    raw.write(text.encode("utf-8"))
+
+            for info in zin.infolist():
+                name = info.filename
+                if logo and posixpath.basename(name).startswith(LOGO_MEDIA_PREFIX):
+                    continue
+                if name == "[Content_Types].xml" and logo:
+                    write_text(name, info.date_time, _content_types(zin, logo.extension, None, None))
+                elif name in headers and logo:
+                    with zin.open(info) as f:
+                        text, _ = _filter_part(f, part_name=name, clear_paragraphs=True,
+                                               first_paragraph_xml=logo_run_xml(logo, shape_id=_shape_id(name)))
+                    write_text(name, info.date_time, text)
+                elif name in footers and footer_text:
+                    with zin.open(info) as f:
+                        text, _ = _filter_part(f, part_name=name, clear_paragraphs=True, drop_last_paragraphs=2,
+                                               closing_xml=footer_paragraphs_xml(footer_text))
+                    write_text(name, info.date_time, text)
+                elif name in header_rels:
+                    rels = _with_logo_relationship(_read_xml(zin, name), header_rels[name], media_dir)
+                    write_text(name, info.date_time, fill(_serialize(rels, NS_PKG_REL)))
+                else:
+                    copy_raw_entry(zin, info, zout)
+            for rels_name, part_name in header_rels.items():
+                if rels_name not in names:
+                    rels = _with_logo_relationship(None, part_name, media_dir)
+                    write_text(rels_name, None, fill(_serialize(rels, NS_PKG_REL)))
+            if logo:
+                zout.writestr(_new_entry(posixpath.join(media_dir, logo.name)), logo.data)
+
+
+def _fill_hole(hole, values, plan, footer_text, logo):
+    kind, argument = hole
+    if kind == "value":
+        key = plan.keys[int(argument)]
+        value = values.get(key)
+        return escape(f"«{key}»" if value is None else value, {"\r": "&#13;"})
+    if kind == "logo_run":
+        return logo_run_xml(logo, shape_id=int(argument))
+    if kind == "logo_name":
+        return logo.name
+    if kind == "footer":
+        return footer_paragraphs_xml(footer_text)
+    raise UnsupportedPackageError(f"Emplacement inconnu : {kind}")
+
+
+def render_docx_plan(plan, source, target, client_data=None, footer_text=None, logo=None):
+    """Produit un document à partir d'un plan compilé : seuls les emplacements sont complétés"""
+    values = {str(key): str(value) for key, value in (client_data or {}).items()}
+    with zipfile.ZipFile(source) as zin, zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as zout:
+        for entry in plan.entries:
+            kind = entry[0]
+            if kind == "raw":
+                copy_raw_entry(zin, zin.getinfo(entry[1]), zout)
+            elif kind == "xml":
+                _, name, date_time, pieces = entry
+                with zout.open(_new_entry(name, date_time), "w") as raw:
+                    out = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+                    for piece in pieces:
+                        out.write(piece if isinstance(piece, str) else _fill_hole(piece, values, plan, footer_text, logo))
+                    out.flush()
+                    out.detach()
+            elif kind == "logo":
+                zout.writestr(_new_entry(posixpath.join(entry[1], logo.name)), logo.data)
+
+
+def _content_hash(source):
+    """Empreinte SHA-256 du contenu d'un fichier (chemin ou objet fichier)"""
+    digest = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    else:
+        position = source.tell()
+        for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        source.seek(position)
+    return digest.hexdigest()
+
+
+# Plans compilés récemment utilisés, par empreinte de template et options de rendu.
+# Chaque plan garde en mémoire le texte XML des parties réécrites (document.xml compris) :
+# le cache est borné en octets, par processus, en plus du nombre de plans
+PLAN_CACHE_SIZE = 32
+PLAN_CACHE_MAX_BYTES = int(os.environ.get("PLAN_CACHE_MAX_MB", "16")) * 1024 * 1024
+_plan_cache = OrderedDict()
+_plan_cache_bytes = 0
+_plan_cache_lock = threading.Lock()
+
+
+def plan_size(plan):
+    """Taille approximative (octets) du texte XML gardé par un plan"""
+    return sum(len(chunk) for entry in plan.entries if entry[0] == "xml"
+               for chunk in entry[3] if isinstance(chunk, str))
+
+
+def get_docx_plan(source, with_values=True, logo_extension=None, with_footer=False):
+    """Retourne le plan compilé d'un template, depuis le cache LRU si le même contenu a déjà été compilé"""
+    global _plan_cache_bytes
+    key = (_content_hash(source), with_values, logo_extension, with_footer)
+    with _plan_cache_lock:
+        cached = _plan_cache.get(key)
+        if cached is not None:
+            _plan_cache.move_to_end(key)
+            return cached[0]
+    plan = compile_docx_plan(source, with_values, logo_extension, with_footer)
+    if not isinstance(source, (str, os.PathLike)):
+        source.seek(0)
+    size = plan_size(plan)
+    if size > PLAN_CACHE_MAX_BYTES:
+        # Template trop volumineux : le plan n'est pas gardé
+        return plan
+    with _plan_cache_lock:
+        previous = _plan_cache.pop(key, None)
+        if previous is not None:
+            _plan_cache_bytes -= previous[1]
+        _plan_cache[key] = (plan, size)
+        _plan_cache_bytes += size
+        while len(_plan_cache) > PLAN_CACHE_SIZE or _plan_cache_bytes > PLAN_CACHE_MAX_BYTES:
+            _, (_, evicted) = _plan_cache.popitem(last=False)
+            _plan_cache_bytes -= evicted
+    return plan
+
+
+def rewrite_docx(source, target, client_data=None, footer_text=None, logo_path=None):
+    """Réécrit un .docx à partir de son plan de rendu compilé.
+
+    Seules la partie principale et les parties d'en-tête et de pied de page sont analysées
+    (avec un analyseur SAX, une seule fois par template) ; toutes les autres entrées,
+    notamment les médias, sont recopiées avec leurs octets compressés d'origine.
+    """
+    logo = get_logo_asset(logo_path) if logo_path else None
+    plan = get_docx_plan(source, bool(client_data), logo.extension if logo else None, bool(footer_text))
+    render_docx_plan(plan, source, target, client_data, footer_text, logo)
+    return plan
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Cache disque des documents générés, adressé par le contenu de toutes les entrées du rendu
+OUTPUT_CACHE_FOLDER = os.environ.get(
+    "OUTPUT_CACHE_FOLDER",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "outputs")
+)
+# Taille maximale du cache (Mo) ; 0 désactive le cache
+OUTPUT_CACHE_MAX_BYTES = int(os.environ.get("OUTPUT_CACHE_MAX_MB", "512")) * 1024 * 1024
+# Fichier voisin de chaque entrée contenant ses informations (JSON)
+METADATA_SUFFIX = ".json"
+# Intervalle (secondes) au-delà duquel la taille du cache est remesurée : les autres processus
+# y écrivent aussi, l'estimation tenue par ce processus ne voit que ses propres écritures
+CACHE_RESCAN_INTERVAL = 60
+# Une éviction ramène le cache à cette fraction de la taille maximale : les écritures suivantes
+# ne déclenchent pas aussitôt un nouveau parcours
+EVICTION_TARGET_RATIO = 0.9
+
+# Taille estimée du cache (octets) et date de la dernière mesure
+_estimated_bytes = None
+_measured_at = 0.0
+_estimate_lock = threading.Lock()
+
+
+def normalize_client_data(client_data):
+    """Représentation stable des données client : l'ordre des clés et le type des valeurs n'y figurent pas"""
+    values = {str(key): str(value) for key, value in (client_data or {}).items()}
+    return json.dumps(values, sort_keys=True, ensure_ascii=False)
+
+
+def output_key(template_data, file_type, client_data=None, footer_text=None, logo_path=None, engine=""):
+    """Empreinte d'un rendu : template, données client, logo, pied de page et version du moteur"""
+    digest = hashlib.sha256()
+    for value in (engine, file_type, normalize_client_data(client_data), footer_text or ""):
+        encoded = value.encode("utf-8")
+        digest.update(len(encoded).to_bytes(8, "big"))
+        digest.update(encoded)
+    digest.update(hashlib.sha256(template_data).digest())
+    if logo_path and os.path.exists(logo_path):
+        with open(logo_path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    else:
+        digest.update(b"\0" * 32)
+    return digest.hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(OUTPUT_CACHE_FOLDER, key[:2], key)
+
+
+def get_cached_output(key):
+    """Retourne les octets d'un rendu déjà produit, ou None"""
+    if OUTPUT_CACHE_MAX_BYTES <= 0:
+        return None
+    path = _entry_path(key)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    # La date de modification sert d'horodatage pour l'éviction des entrées les moins récentes
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return data
+
+
+def get_cached_metadata(key):
+    """Retourne les informations enregistrées avec un rendu (rapport de traitement), ou None"""
+    if OUTPUT_CACHE_MAX_BYTES <= 0:
+        return None
+    try:
+        with open(_entry_path(key) + METADATA_SUFFIX, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path, data):
+    # Écriture atomique : un autre processus ne lit jamais une entrée incomplète
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def store_output(key, data, metadata=None):
+    """Conserve un rendu (et ses informations) puis évince les entrées les plus anciennes au-delà de la taille maximale"""
+    if OUTPUT_CACHE_MAX_BYTES <= 0 or len(data) > OUTPUT_CACHE_MAX_BYTES:
+        return
+    path = _entry_path(key)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if metadata is not None:
+            _write_atomic(path + METADATA_SUFFIX, json.dumps(metadata, ensure_ascii=False).encode("utf-8"))
+        _write_atomic(path, data)
+    except OSError as e:
+        print(f"⚠️ Impossible d'écrire dans le cache des sorties : {str(e)}")
+        return
+    _account_stored(len(data))
+
+
+def _account_stored(size):
+    """Ajoute une écriture à la taille estimée ; le cache n'est parcouru que si elle dépasse
+    la taille maximale ou si la dernière mesure est trop ancienne"""
+    global _estimated_bytes, _measured_at
+    with _estimate_lock:
+        stale = _estimated_bytes is None or time.monotonic() - _measured_at > CACHE_RESCAN_INTERVAL
+        if not stale:
+            _estimated_bytes += size
+            if _estimated_bytes <= OUTPUT_CACHE_MAX_BYTES:
+                return
+            total = evict_outputs(int(OUTPUT_CACHE_MAX_BYTES * EVICTION_TARGET_RATIO))
+        else:
+            total = evict_outputs()
+        _estimated_bytes = total
+        _measured_at = time.monotonic()
+
+
+def evict_outputs(max_bytes=None):
+    """Supprime les entrées les moins récemment utilisées jusqu'à repasser sous la taille maximale.
+    
+    Parcourt tout le cache ; retourne sa taille après éviction (octets).
+    """
+    max_bytes = OUTPUT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    total = 0
+    try:
+        folders = list(os.scandir(OUTPUT_CACHE_FOLDER))
+    except OSError:
+        return 0
+    for folder in folders:
+        if not folder.is_dir():
+            continue
+        for entry in os.scandir(folder.path):
+            if entry.name.endswith((".tmp", METADATA_SUFFIX)):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    if total <= max_bytes:
+        return total
+    entries.sort()
+    for _, size, path in entries:
+        for name in (path, path + METADATA_SUFFIX):
+            try:
+                os.remove(name)
+            except OSError:
+                # Déjà supprimée par un autre processus, ou sans informations
+                pass
+        total -= size
+        if total <= max_bytes:
+            break
+    return total
@@ -0,0 +1,334 @@
+import atexit
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, as_completed
+from pathlib import Path
+
+# Exécutable LibreOffice (par défaut : soffice ou libreoffice dans le PATH)
+SOFFICE_PATH = os.environ.get("SOFFICE_PATH") or shutil.which("soffice") or shutil.which("libreoffice")
+# Nombre de processus LibreOffice gardés ouverts
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", "0")) or min(2, os.cpu_count() or 1)
+# Conversions en attente au maximum : au-delà, la soumission attend qu'un processus se libère
+PDF_QUEUE_SIZE = int(os.environ.get("PDF_QUEUE_SIZE", "64"))
+# Durée maximale d'une conversion (secondes) : au-delà, le processus est arrêté puis relancé
+PDF_TIMEOUT = int(os.environ.get("PDF_TIMEOUT", "120"))
+# Durée maximale de démarrage d'un processus LibreOffice (secondes)
+PDF_START_TIMEOUT = int(os.environ.get("PDF_START_TIMEOUT", "60"))
+
+# Filtres d'export PDF par type de document
+PDF_EXPORT_FILTERS = {
+    '.docx': "writer_pdf_Export",
+    '.xlsx': "calc_pdf_Export",
+    '.pptx': "impress_pdf_Export",
+}
+
+
+def pdf_conversion_available():
+    """Vrai si LibreOffice est installé sur la machine"""
+    return bool(SOFFICE_PATH)
+
+
+def pdf_path_for(file_name, output_dir):
+    """Chemin du PDF correspondant à un document"""
+    return os.path.join(output_dir, Path(file_name).stem + ".pdf")
+
+
+def _soffice_command(profile_dir, *arguments):
+    # Un profil utilisateur par processus : plusieurs instances peuvent tourner en parallèle
+    return [SOFFICE_PATH, "--headless", "--invisible", "--nologo", "--nodefault", "--norestore",
+            "--nolockcheck", f"-env:UserInstallation={Path(profile_dir).as_uri()}", *arguments]
+
+
+class _UnoWorker:
+    """Processus LibreOffice gardé ouvert, piloté par UNO : le démarrage n'est payé qu'une fois"""
+
+    def __init__(self, index, profile_dir):
+        import uno
+
+        self.uno = uno
+        self.pipe_name = f"placeandreplace_{os.getpid()}_{index}"
+        self.process = subprocess.Popen(
+            _soffice_command(profile_dir, f"--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext"),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+        )
+        self.desktop = self._connect()
+
+    def _connect(self):
+        local_context = self.uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_context)
+        deadline = time.monotonic() + PDF_START_TIMEOUT
+        while True:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"LibreOffice s'est arrêté au démarrage (code {self.process.returncode})")
+            try:
+                context = resolver.resolve(
+                    f"uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext")
+                break
+            except Exception:
+                # Le processus n'accepte pas encore de connexion
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise TimeoutError("LibreOffice n'a pas démarré à temps")
+                time.sleep(0.25)
+        return context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+
+    def _properties(self, **values):
+        from com.sun.star.beans import PropertyValue
+
+        properties = []
+        for name, value in values.items():
+            item = PropertyValue()
+            item.Name = name
+            item.Value = value
+            properties.append(item)
+        return tuple(properties)
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def convert(self, input_path, output_path):
+        filter_name = PDF_EXPORT_FILTERS.get(Path(input_path).suffix.lower(), "writer_pdf_Export")
+        document = self.desktop.loadComponentFromURL(
+            self.uno.systemPathToFileUrl(os.path.abspath(input_path)), "_blank", 0,
+            self._properties(Hidden=True, ReadOnly=True))
+        if document is None:
+            raise RuntimeError(f"LibreOffice n'a pas pu ouvrir {input_path}")
+        try:
+            document.storeToURL(self.uno.systemPathToFileUrl(os.path.abspath(output_path)),
+                                self._properties(FilterName=filter_name))
+        finally:
+            document.close(True)
+
+    def stop(self):
+        """Arrêt normal : LibreOffice est invité à se fermer, puis arrêté s'il ne répond pas"""
+        # Appel UNO synchrone : borné pour ne pas bloquer sur un processus qui ne répond plus
+        terminate = threading.Thread(target=self._terminate, daemon=True)
+        terminate.start()
+        terminate.join(timeout=5)
+        _stop_process(self.process)
+
+    def _terminate(self):
+        try:
+            self.desktop.terminate()
+        except Exception:
+            pass
+
+    def kill(self):
+        """Arrêt immédiat, sans appel UNO : utilisé lorsque le processus est bloqué"""
+        _stop_process(self.process)
+
+
+class _SubprocessWorker:
+    """Conversion par ligne de commande, lorsque le module uno n'est pas disponible.
+
+    Un processus est lancé pour chaque fichier ; le profil utilisateur est conservé
+    d'un fichier à l'autre, ce qui évite de le recréer à chaque démarrage.
+    """
+
+    def __init__(self, index, profile_dir):
+        self.profile_dir = profile_dir
+        self.process = None
+
+    def alive(self):
+        return True
+
+    def convert(self, input_path, output_path):
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(output_path)) as temp_dir:
+            self.process = subprocess.Popen(
+                _soffice_command(self.profile_dir, "--convert-to", "pdf", "--outdir", temp_dir, input_path),
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+            )
+            try:
+                returncode = self.process.wait()
+            finally:
+                self.process = None
+            produced = os.path.join(temp_dir, Path(input_path).stem + ".pdf")
+            if returncode != 0 or not os.path.exists(produced):
+                raise RuntimeError(f"LibreOffice a échoué (code {returncode})")
+            shutil.move(produced, output_path)
+
+    def stop(self):
+        # Lu une seule fois : convert() remet self.process à None pendant qu'un arrêt est en cours
+        process = self.process
+        if process is not None:
+            _stop_process(process)
+
+    kill = stop
+
+
+def _signal_group(process, sig):
+    # soffice est un lanceur : le groupe de processus comprend aussi soffice.bin
+    try:
+        os.killpg(process.pid, sig)
+    except OSError:
+        pass
+
+
+def _stop_process(process):
+    if process.poll() is not None:
+        return
+    _signal_group(process, signal.SIGTERM)
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        _signal_group(process, signal.SIGKILL)
+        process.wait()
+
+
+def _worker_class():
+    try:
+        import uno  # noqa: F401
+    except ImportError:
+        print("⚠️ Module uno introuvable (paquet python3-uno) : un processus LibreOffice "
+              "est lancé pour chaque conversion, sans pool de processus gardés ouverts")
+        return _SubprocessWorker
+    return _UnoWorker
+
+
+class PdfConverterPool:
+    """Pool de processus LibreOffice convertissant les documents en PDF.
+
+    Les conversions passent par une file bornée ; chaque thread possède un processus
+    LibreOffice, relancé s'il s'arrête ou dépasse la durée maximale d'une conversion.
+    """
+
+    def __init__(self, workers=PDF_WORKERS, queue_size=PDF_QUEUE_SIZE, timeout=PDF_TIMEOUT):
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._worker_class = _worker_class()
+        self._profiles = tempfile.mkdtemp(prefix="placeandreplace_soffice_")
+        self._threads = [
+            threading.Thread(target=self._run, args=(index,), name=f"pdf-{index}", daemon=True)
+            for index in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, input_path, output_path):
+        """Ajoute une conversion à la file (attend si elle est pleine) et retourne son Future"""
+        future = Future()
+        self._queue.put((future, input_path, output_path))
+        return future
+
+    def _run(self, index):
+        profile_dir = os.path.join(self._profiles, str(index))
+        worker = None
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            future, input_path, output_path = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if worker is None or not worker.alive():
+                    if worker is not None:
+                        print(f"⚠️ Processus LibreOffice {index} arrêté, redémarrage")
+                    worker = self._worker_class(index, profile_dir)
+                self._convert(worker, input_path, output_path)
+                future.set_result(output_path)
+            except Exception as e:
+                # Processus dans un état inconnu : il est remplacé à la conversion suivante
+                if worker is not None:
+                    worker.kill()
+                worker = None
+                future.set_exception(e)
+        if worker is not None:
+            worker.stop()
+
+    def _convert(self, worker, input_path, output_path):
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        # Écriture dans un fichier temporaire : un PDF incomplet n'est jamais proposé
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(output_path) or ".", suffix=".pdf.tmp")
+        os.close(fd)
+        # Arrêt du processus au-delà de la durée maximale : l'appel en cours échoue alors
+        timed_out = threading.Event()
+
+        def expire():
+            timed_out.set()
+            # Le processus bloqué ne répondrait pas à un appel UNO : il est arrêté directement
+            worker.kill()
+
+        timer = threading.Timer(self.timeout, expire)
+        timer.start()
+        try:
+            worker.convert(input_path, temp_path)
+            if timed_out.is_set():
+                raise TimeoutError
+            os.replace(temp_path, output_path)
+        except Exception as e:
+            if timed_out.is_set():
+                raise TimeoutError(f"Conversion de {input_path} interrompue après {self.timeout} s") from e
+            raise
+        finally:
+            timer.cancel()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def shutdown(self):
+        """Arrête les processus LibreOffice après les conversions en attente"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        shutil.rmtree(self._profiles, ignore_errors=True)
+
+
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
+
+
+def get_pdf_pool():
+    """Retourne le pool de conversion partagé, créé au premier appel"""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = PdfConverterPool()
+        return _pdf_pool
+
+
+@atexit.register
+def shutdown_pdf_pool():
+    """Arrête le pool de conversion partagé et ses processus LibreOffice"""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        pool, _pdf_pool = _pdf_pool, None
+    if pool is not None:
+        pool.shutdown()
+
+
+def convert_files_to_pdf(paths, output_dir):
+    """Convertit des documents en PDF dans output_dir, en parallèle.
+
+    Les résultats sont produits dès qu'ils sont prêts : (chemin, chemin du PDF ou None).
+    Un PDF précédent dont la conversion échoue est supprimé pour ne pas proposer une version périmée.
+    """
+    if not paths:
+        return
+    if not pdf_conversion_available():
+        print("⚠️ LibreOffice introuvable : aucune version PDF n'est générée")
+        for path in paths:
+            yield path, None
+        return
+    pool = get_pdf_pool()
+    futures = {}
+    for path in paths:
+        futures[pool.submit(path, pdf_path_for(path, output_dir))] = path
+    for future in as_completed(futures):
+        path = futures[future]
+        try:
+            yield path, future.result()
+        except Exception as e:
+            print(f"❌ Erreur lors de la conversion PDF de {path}: {str(e)}")
+            try:
+                os.remove(pdf_path_for(path, output_dir))
+            except OSError:
+                pass
+            yield path, None
@@ -0,0 +1,81 @@
+import re
+from bisect import bisect_right
+from collections import Counter
+
+# Motif unique pour toutes les variables «clé» : une seule passe par texte,
+# quel que soit le nombre de clés du client
+PLACEHOLDER_PATTERN = re.compile(r"«([^«»]+)»")
+
+
+class PlaceholderReplacer:
+    """Remplace en un seul passage toutes les variables «clé» d'un texte par les données du client"""
+
+    def __init__(self, client_data):
+        # Construit une seule fois par jeu de données client
+        self.values = {str(key): str(value) for key, value in client_data.items()}
+        # Remplacements effectués par (partie, clé) ; `part` désigne la partie en cours de traitement
+        self.counts = Counter()
+        self.part = None
+
+    def lookup(self, key):
+        """Retourne la valeur associée à une clé, ou None si la clé est inconnue"""
+        return self.values.get(key)
+
+    def _substitute(self, match):
+        value = self.lookup(match.group(1))
+        if value is None:
+            return match.group(0)
+        self.counts[(self.part, match.group(1))] += 1
+        return value
+
+    def __call__(self, text):
+        """Retourne le texte avec toutes les variables connues remplacées"""
+        if not text or "«" not in text:
+            return text
+        return PLACEHOLDER_PATTERN.sub(self._substitute, text)
+
+    def replace_segments(self, segments, found=None):
+        """Remplace les variables d'un texte découpé en segments (runs) sans fusionner les segments.
+
+        La valeur prend la place de la variable dans le segment où elle commence ; les caractères
+        de la variable sont retirés des segments suivants qu'elle chevauche. Retourne None si
+        aucune variable connue n'a été trouvée. Si `found` est une liste, elle reçoit
+        l'emplacement de chaque variable remplacée : (segment, position, clé).
+        """
+        text = "".join(segments)
+        if "«" not in text:
+            return None
+        matches = []
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            value = self.lookup(match.group(1))
+            if value is not None:
+                matches.append((match.start(), match.end(), match.group(1), value))
+        if not matches:
+            return None
+
+        starts = []
+        position = 0
+        for segment in segments:
+            starts.append(position)
+            position += len(segment)
+
+        # En partant de la fin, les positions des variables précédentes restent valables
+        result = list(segments)
+        for start, end, key, value in reversed(matches):
+            self.counts[(self.part, key)] += 1
+            index = bisect_right(starts, start) - 1
+            if found is not None:
+                found.append((index, start - starts[index], key))
+            replacement = value
+            while index < len(segments) and starts[index] < end:
+                segment_start = starts[index]
+                segment_end = segment_start + len(segments[index])
+                if segment_end > start:
+                    low = max(start, segment_start) - segment_start
+                    high = min(end, segment_end) - segment_start
+                    result[index] = result[index][:low] + replacement + result[index][high:]
+                    replacement = ""
+                index += 1
+        if found is not None:
+            found.reverse()
+        return result
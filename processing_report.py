@@ -0,0 +1,56 @@
+from dataclasses import dataclass, field, asdict, fields
+
+
+@dataclass
+class ProcessingReport:
+    """Résultat structuré du traitement d'un fichier, utilisé pour le rapport de traitement"""
+    file_name: str = ""
+    engine: str = ""
+    # Remplacements effectués : partie du document -> {clé: nombre}
+    substitutions: dict = field(default_factory=dict)
+    headers_rewritten: int = 0
+    footers_rewritten: int = 0
+    logo_embedded: bool = False
+    bytes_in: int = 0
+    bytes_out: int = 0
+    from_cache: bool = False
+    warnings: list = field(default_factory=list)
+
+    def add_substitutions(self, counts):
+        """Ajoute des remplacements comptés par (partie, clé)"""
+        for (part, key), count in counts.items():
+            keys = self.substitutions.setdefault(part, {})
+            keys[key] = keys.get(key, 0) + count
+
+    @property
+    def total_substitutions(self):
+        return sum(sum(keys.values()) for keys in self.substitutions.values())
+
+    @property
+    def modified(self):
+        """Vrai si le traitement a changé quelque chose dans le document"""
+        return bool(self.total_substitutions or self.headers_rewritten or self.footers_rewritten
+                    or self.logo_embedded)
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        names = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in names})
+
+    def report_lines(self):
+        """Lignes du rapport de traitement décrivant ce qui a été modifié"""
+        lines = [f"Moteur : {self.engine}" + (" (depuis le cache)" if self.from_cache else "")]
+        lines.append(f"Variables remplacées : {self.total_substitutions}")
+        for part, keys in sorted(self.substitutions.items()):
+            details = ", ".join(f"{key} × {count}" for key, count in sorted(keys.items()))
+            lines.append(f"  - {part} : {details}")
+        lines.append(f"En-têtes réécrits : {self.headers_rewritten}")
+        lines.append(f"Pieds de page réécrits : {self.footers_rewritten}")
+        lines.append(f"Logo intégré : {'oui' if self.logo_embedded else 'non'}")
+        lines.append(f"Taille : {self.bytes_in} octets → {self.bytes_out} octets")
+        for warning in self.warnings:
+            lines.append(f"⚠️ {warning}")
+        return lines
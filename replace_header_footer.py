@@ -1,19 +1,60 @@
 import os
+import sys
+import argparse
+import hashlib
+import json
+import time
 from pathlib import Path
 from docx import Document
 from docx.shared import Inches
 import subprocess
 import platform
 import shutil
+import re
+import zipfile
+from copy import copy
+from io import BytesIO
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from placeholders import PlaceholderReplacer
+from processing_report import ProcessingReport
+from ooxml_stream import rewrite_docx, refresh_docx_header_footer, UnsupportedPackageError
+from xlsx_stream import rewrite_xlsx
+from logo_assets import get_logo_asset, LOGO_DPI
+from output_cache import output_key, get_cached_output, get_cached_metadata, store_output
 
 # Configuration des chemins
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 INPUT_FOLDER = os.path.join(SCRIPT_DIR, "input_docs")
 OUTPUT_FOLDER = os.path.join(SCRIPT_DIR, "output_docs")
 PDF_OUTPUT_FOLDER = os.path.join(SCRIPT_DIR, "pdf_output")
-LOGO_PATH = os.path.join(SCRIPT_DIR, "logo.png")
+LOGO_PATH = os.environ.get("LOGO_PATH") or os.path.join(SCRIPT_DIR, "logo.png")
 FOOTER_PATH = os.path.join(SCRIPT_DIR, "footer.txt")
 
+# Moteur de traitement des .docx : "stream" (réécriture en flux de l'archive) ou "python-docx"
+DOCX_ENGINE = os.environ.get("DOCX_ENGINE", "stream")
+
+# Moteur de traitement des .xlsx : "stream" (chaînes partagées réécrites dans l'archive) ou "openpyxl"
+XLSX_ENGINE = os.environ.get("XLSX_ENGINE", "stream")
+
+# Emplacement du logo et du pied de page dans les .pptx : "slides" (sur chaque diapositive),
+# "master" (une fois sur chaque masque) ou "layouts" (une fois sur chaque disposition utilisée,
+# y compris celles qui masquent les formes du masque)
+PPTX_DECORATION = os.environ.get("PPTX_DECORATION", "slides")
+
+# Taille (Mo, XML décompressé des feuilles) à partir de laquelle un .xlsx est traité
+# en flux (openpyxl en lecture seule / écriture seule) pour borner la mémoire
+XLSX_STREAMING_THRESHOLD = int(os.environ.get("XLSX_STREAMING_THRESHOLD_MB", "20")) * 1024 * 1024
+
+# Version du rendu, incluse dans les clés du cache des sorties : à incrémenter dès que
+# le document produit pour des entrées identiques change
+RENDER_VERSION = "4"
+
+# Nombre de processus de traitement en parallèle (par défaut : nombre de cœurs)
+MAX_WORKERS = int(os.environ.get("MAX_WORKERS", "0")) or os.cpu_count() or 1
+
 # Extensions supportées
 SUPPORTED_EXTENSIONS = {
     '.docx': 'Document Word',
@@ -40,22 +81,64 @@ def get_footer_text():
             f.write(default_footer)
         return default_footer
 
-def process_document(doc_path, output_path, footer_text):
-    """Traite un document Word"""
+def rewrite_docx_stream(input_path, output_path, client_data=None, footer_text=None, logo_path=None):
+    """Traite un .docx avec le moteur en flux et retourne son plan ; None s'il doit passer par python-docx"""
+    if DOCX_ENGINE != "stream":
+        return None
+    if logo_path and not os.path.exists(logo_path):
+        logo_path = None
+    try:
+        return rewrite_docx(input_path, output_path, client_data, footer_text, logo_path)
+    except UnsupportedPackageError as e:
+        print(f"⚠️ Moteur en flux indisponible pour {input_path} ({str(e)}), utilisation de python-docx")
+        return None
+
+def iter_header_footer_parts(doc, kind):
+    """Parcourt chaque en-tête (kind="header") ou pied de page (kind="footer") distinct une seule fois.
+
+    Les sections liées à la précédente et celles qui partagent la même partie ne sont pas
+    reparcourues. Les variantes première page et pages paires sont des parties à part,
+    traitées lorsqu'elles sont actives et définies.
+    """
+    even_pages = doc.settings.odd_and_even_pages_header_footer
+    seen = set()
+    for index, section in enumerate(doc.sections):
+        variants = [getattr(section, kind)]
+        if section.different_first_page_header_footer:
+            variants.append(getattr(section, f"first_page_{kind}"))
+        if even_pages:
+            variants.append(getattr(section, f"even_page_{kind}"))
+        for variant_index, item in enumerate(variants):
+            # Sans définition propre : la partie de la section précédente est affichée (déjà traitée).
+            # L'en-tête par défaut de la première section est créé s'il n'existe pas.
+            if item.is_linked_to_previous and (index > 0 or variant_index > 0):
+                continue
+            if id(item.part) in seen:
+                continue
+            seen.add(id(item.part))
+            yield item
+
+def process_document(doc_path, output_path, footer_text, logo_path=None):
+    """Traite un document Word (logo par défaut : LOGO_PATH)"""
+    logo_path = logo_path or LOGO_PATH
+    if rewrite_docx_stream(doc_path, output_path, footer_text=footer_text, logo_path=logo_path):
+        return
+    
     doc = Document(doc_path)
+    # Logo préparé une seule fois : toutes les sections partagent la même image
+    logo = get_logo_asset(logo_path)
     
-    for section in doc.sections:
+    for header in iter_header_footer_parts(doc, "header"):
         # Modification de l'en-tête
-        header = section.header
         for paragraph in header.paragraphs:
             paragraph.clear()
         if not header.paragraphs:
             header.add_paragraph()
         run = header.paragraphs[0].add_run()
-        run.add_picture(LOGO_PATH, width=Inches(1.5))
-        
+        run.add_picture(logo.stream(), width=Inches(1.5))
+    
+    for footer in iter_header_footer_parts(doc, "footer"):
         # Modification du pied de page
-        footer = section.footer
         for paragraph in footer.paragraphs:
             paragraph.clear()
         if not footer.paragraphs:
@@ -71,248 +154,841 @@ def process_document(doc_path, output_path, footer_text):
     
     doc.save(output_path)
 
-def process_file(input_path, output_path, file_type, footer_text):
-    """Traite un fichier selon son type"""
+def _engine_tag(mode):
+    """Identifie le moteur et ses réglages dans les clés du cache des sorties"""
+    return f"{mode}:{RENDER_VERSION}:{DOCX_ENGINE}:{XLSX_ENGINE}:{PPTX_DECORATION}:{LOGO_DPI}"
+
+def process_document_cached(doc_path, output_path, footer_text, logo_path=None):
+    """Traite un document Word, ou recopie le résultat d'un traitement identique déjà en cache"""
+    logo_path = logo_path or LOGO_PATH
+    key = output_key(Path(doc_path).read_bytes(), '.docx', None, footer_text, logo_path, _engine_tag("document"))
+    cached = get_cached_output(key)
+    if cached is not None:
+        Path(output_path).write_bytes(cached)
+        return
+    process_document(doc_path, output_path, footer_text, logo_path)
+    store_output(key, Path(output_path).read_bytes())
+
+def process_file(input_path, output_path, file_type, footer_text, logo_path=None):
+    """Traite un fichier selon son type (logo par défaut : LOGO_PATH).
+    
+    Retourne True seulement si le fichier a été traité et que la sortie existe.
+    """
     try:
         if file_type == '.docx':
-            process_document(input_path, output_path, footer_text)
-        elif file_type == '.xlsx':
-            # Pour les fichiers Excel, on copie simplement le fichier pour l'instant
-            # car la bibliothèque python-docx ne gère pas les fichiers Excel
-            shutil.copy2(input_path, output_path)
-        return True
+            process_document_cached(input_path, output_path, footer_text, logo_path)
+        elif file_type in TEMPLATE_RENDERERS:
+            # Excel et PowerPoint : logo et pied de page seulement, sans données client
+            report = render_template(input_path, output_path, file_type, {}, footer_text, logo_path or LOGO_PATH)
+            if report.engine == "copie":
+                # Le moteur n'a pu que recopier le fichier : ce n'est pas un traitement réussi
+                print(f"❌ {input_path} recopié sans traitement : {'; '.join(report.warnings)}")
+                os.remove(output_path)
+                return False
+        else:
+            print(f"⚠️ Type de fichier non pris en charge : {input_path}")
+            return False
+        return os.path.exists(output_path)
     except Exception as e:
         print(f"❌ Erreur lors du traitement de {input_path}: {str(e)}")
         return False
 
-def replace_variables_in_document(doc_path, output_path, client_data):
-    """Remplace les variables dans un document Word par les données du client"""
-    doc = Document(doc_path)
+def refresh_file(input_path, output_path, file_type, footer_text, logo_path=None):
+    """Met à jour le logo et le pied de page d'un fichier déjà traité sans retraiter son contenu.
     
+    Le fichier est entièrement retraité depuis l'original si la sortie n'existe pas encore
+    ou si la mise à jour incrémentale n'est pas possible.
+    """
+    if file_type != '.docx' or DOCX_ENGINE != "stream" or not os.path.exists(output_path):
+        return process_file(input_path, output_path, file_type, footer_text, logo_path)
+    temp_path = f"{output_path}.tmp"
+    try:
+        effective_logo = logo_path or LOGO_PATH
+        refresh_docx_header_footer(output_path, temp_path, footer_text,
+                                   effective_logo if os.path.exists(effective_logo) else None)
+        os.replace(temp_path, output_path)
+        return True
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        if not isinstance(e, UnsupportedPackageError):
+            print(f"⚠️ Mise à jour incrémentale impossible pour {output_path} ({str(e)})")
+        return process_file(input_path, output_path, file_type, footer_text, logo_path)
+
+def replace_in_paragraphs(paragraphs, replacer):
+    """Remplace les variables d'une liste de paragraphes en une seule passe par paragraphe"""
+    for paragraph in paragraphs:
+        text = paragraph.text
+        new_text = replacer(text)
+        # Ne reconstruire le paragraphe que si une variable a été trouvée
+        if new_text != text:
+            paragraph.text = new_text
+
+def _part_name(part):
+    """Nom d'une partie python-docx dans l'archive (word/document.xml, word/header1.xml...)"""
+    return str(part.partname).lstrip("/")
+
+def replace_variables_in_docx(doc, replacer):
+    """Remplace les variables dans un document Word déjà chargé"""
     # Parcourir tous les paragraphes du document
-    for paragraph in doc.paragraphs:
-        for key, value in client_data.items():
-            if f"«{key}»" in paragraph.text:
-                paragraph.text = paragraph.text.replace(f"«{key}»", value)
+    replacer.part = _part_name(doc.part)
+    replace_in_paragraphs(doc.paragraphs, replacer)
     
     # Parcourir toutes les tables
     for table in doc.tables:
         for row in table.rows:
             for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    for key, value in client_data.items():
-                        if f"«{key}»" in paragraph.text:
-                            paragraph.text = paragraph.text.replace(f"«{key}»", value)
-    
-    # Parcourir les en-têtes et pieds de page
-    for section in doc.sections:
-        # En-têtes
-        header = section.header
-        for paragraph in header.paragraphs:
-            for key, value in client_data.items():
-                if f"«{key}»" in paragraph.text:
-                    paragraph.text = paragraph.text.replace(f"«{key}»", value)
-        
-        # Pieds de page
-        footer = section.footer
-        for paragraph in footer.paragraphs:
-            for key, value in client_data.items():
-                if f"«{key}»" in paragraph.text:
-                    paragraph.text = paragraph.text.replace(f"«{key}»", value)
+                replace_in_paragraphs(cell.paragraphs, replacer)
+    
+    # Parcourir les en-têtes et pieds de page (chaque partie une seule fois)
+    for kind in ("header", "footer"):
+        for item in iter_header_footer_parts(doc, kind):
+            replacer.part = _part_name(item.part)
+            replace_in_paragraphs(item.paragraphs, replacer)
+
+def replace_variables_in_document(doc_path, output_path, client_data):
+    """Remplace les variables dans un document Word par les données du client"""
+    doc = Document(doc_path)
+    replace_variables_in_docx(doc, PlaceholderReplacer(client_data))
     
     # Sauvegarder le document modifié
     doc.save(output_path)
     return True
 
-def process_client_template(input_path, output_path, file_type, client_data, footer_text=None, logo_path=None):
-    """Traite un template client selon son type"""
-    try:
-        if file_type == '.docx':
-            # Créer une copie temporaire du fichier d'entrée
-            temp_file = output_path + ".tmp.docx"
-            shutil.copy2(input_path, temp_file)
+def add_docx_header_footer(doc, footer_text=None, logo_path=None):
+    """Ajoute le logo dans les en-têtes et le texte dans les pieds de page d'un document chargé.
+    
+    Retourne le nombre d'en-têtes et de pieds de page réécrits.
+    """
+    headers = footers = 0
+    # Modifier les en-têtes si un logo est fourni et existe
+    if logo_path and os.path.exists(logo_path):
+        logo = get_logo_asset(logo_path)
+        for header in iter_header_footer_parts(doc, "header"):
+            for paragraph in header.paragraphs:
+                paragraph.clear()
+            if not header.paragraphs:
+                header.add_paragraph()
+            run = header.paragraphs[0].add_run()
+            try:
+                run.add_picture(logo.stream(), width=Inches(1.5))
+                headers += 1
+            except Exception as e:
+                print(f"⚠️ Erreur lors de l'ajout du logo : {str(e)}")
+    
+    # Modifier les pieds de page si demandé
+    if footer_text:
+        for footer in iter_header_footer_parts(doc, "footer"):
+            for paragraph in footer.paragraphs:
+                paragraph.clear()
+            if not footer.paragraphs:
+                footer.add_paragraph()
             
-            # Remplacer les variables
-            replace_variables_in_document(temp_file, output_path, client_data)
+            # Ajout d'espaces pour positionner le pied de page plus bas
+            for _ in range(2):
+                footer.add_paragraph()
             
-            # Vérifier si le fichier a été modifié
-            if not os.path.exists(output_path):
-                raise Exception("Le fichier n'a pas été créé")
+            # Ajout du texte du pied de page
+            last_paragraph = footer.paragraphs[-1]
+            last_paragraph.text = footer_text
+            footers += 1
+    return headers, footers
+
+def _rewind(source, target=None):
+    """Replace les flux en mémoire au début (la cible est vidée) avant un nouvel essai"""
+    if hasattr(source, "seek"):
+        source.seek(0)
+    if target is not None and hasattr(target, "seek"):
+        target.seek(0)
+        target.truncate()
+
+def _copy_source(source, target):
+    """Copie le template tel quel vers la cible (chemins ou flux en mémoire)"""
+    _rewind(source, target)
+    if isinstance(source, (str, os.PathLike)) and isinstance(target, (str, os.PathLike)):
+        shutil.copy2(source, target)
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            shutil.copyfileobj(f, target)
+    elif isinstance(target, (str, os.PathLike)):
+        with open(target, "wb") as f:
+            shutil.copyfileobj(source, f)
+    else:
+        shutil.copyfileobj(source, target)
+
+def render_docx(source, target, client_data, footer_text=None, logo_path=None):
+    """Traite un template Word : un seul chargement, une seule sauvegarde, sans fichier intermédiaire"""
+    plan = rewrite_docx_stream(source, target, client_data, footer_text, logo_path)
+    if plan is not None:
+        report = ProcessingReport(engine="stream", headers_rewritten=len(plan.headers),
+                                  footers_rewritten=len(plan.footers), logo_embedded=bool(plan.headers))
+        values = {str(key) for key in (client_data or {})}
+        report.add_substitutions(Counter((part, key) for part, _, _, _, key in plan.placeholders if key in values))
+        return report
+    
+    _rewind(source, target)
+    doc = Document(source)
+    replacer = PlaceholderReplacer(client_data)
+    replace_variables_in_docx(doc, replacer)
+    headers, footers = add_docx_header_footer(doc, footer_text, logo_path)
+    doc.save(target)
+    report = ProcessingReport(engine="python-docx", headers_rewritten=headers,
+                              footers_rewritten=footers, logo_embedded=headers > 0)
+    report.add_substitutions(replacer.counts)
+    return report
+
+def xlsx_sheets_size(source):
+    """Taille décompressée des feuilles d'un classeur, lue dans l'index de l'archive"""
+    try:
+        with zipfile.ZipFile(source) as archive:
+            return sum(info.file_size for info in archive.infolist()
+                       if info.filename.startswith("xl/worksheets/"))
+    except zipfile.BadZipFile:
+        return 0
+    finally:
+        _rewind(source)
+
+# Éléments des feuilles que le traitement en flux openpyxl ne recopie pas : un classeur
+# qui en contient passe par un moteur qui les conserve
+_XLSX_STREAMING_LOSSES = {
+    b"mergeCell": "cellules fusionnées",
+    b"cols": "largeurs de colonnes",
+    b"row": "hauteurs de lignes ou lignes masquées",
+    b"drawing": "images ou graphiques",
+    b"legacyDrawing": "commentaires",
+    b"conditionalFormatting": "mise en forme conditionnelle",
+    b"dataValidations": "listes de validation",
+    b"hyperlinks": "liens",
+    b"pane": "volets figés",
+    b"autoFilter": "filtres",
+    b"tableParts": "tableaux",
+}
+_XLSX_STREAMING_LOSS_PATTERN = re.compile(
+    rb"<(?:\w+:)?(mergeCell|cols|drawing|legacyDrawing|conditionalFormatting|dataValidations"
+    rb"|hyperlinks|pane|autoFilter|tableParts)\b"
+    rb"|<(?:\w+:)?(row)\b[^>]*\b(?:customHeight|hidden)=\"(?:1|true)\""
+)
+
+def xlsx_streaming_loss(source):
+    """Premier élément du classeur que le traitement en flux openpyxl perdrait, ou None.
+    
+    Les feuilles sont lues par morceaux depuis l'archive : la mémoire reste bornée.
+    """
+    try:
+        with zipfile.ZipFile(source) as archive:
+            names = archive.namelist()
+            if any(name.startswith("xl/chartsheets/") for name in names):
+                return "feuilles de graphique"
+            if re.search(rb"<(?:\w+:)?definedName\b", archive.read("xl/workbook.xml")):
+                return "plages nommées"
+            for name in names:
+                if not (name.startswith("xl/worksheets/") and name.endswith(".xml")):
+                    continue
+                with archive.open(name) as f:
+                    tail = b""
+                    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                        # Recouvrement entre morceaux : une balise coupée en deux est retrouvée
+                        match = _XLSX_STREAMING_LOSS_PATTERN.search(tail + chunk)
+                        if match:
+                            return _XLSX_STREAMING_LOSSES[match.group(1) or match.group(2)]
+                        tail = chunk[-256:]
+    except (zipfile.BadZipFile, KeyError):
+        return None
+    finally:
+        _rewind(source)
+    return None
+
+def render_xlsx_streaming(source, target, client_data, footer_text=None, logo_path=None):
+    """Traite un grand template Excel ligne par ligne : mémoire bornée quelle que soit la taille des feuilles.
+    
+    Les valeurs, formules et styles des cellules sont conservés. Les classeurs contenant ce que
+    ce traitement ne recopie pas (voir xlsx_streaming_loss) ne lui sont pas confiés.
+    """
+    import openpyxl
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.drawing.image import Image
+    
+    report = ProcessingReport(engine="openpyxl (flux)")
+    replacer = PlaceholderReplacer(client_data)
+    source_wb = openpyxl.load_workbook(source, read_only=True)
+    try:
+        wb = openpyxl.Workbook(write_only=True)
+        # Styles du template déjà décodés : indices du template -> objets de style
+        styles = {}
+        
+        for index, source_ws in enumerate(source_wb.worksheets):
+            ws = wb.create_sheet(source_ws.title)
+            ws.sheet_state = source_ws.sheet_state
+            replacer.part = source_ws.title
             
-            # Ajouter le logo et le pied de page si demandé
-            if footer_text or (logo_path and os.path.exists(logo_path)):
-                doc = Document(output_path)
-                
-                for section in doc.sections:
-                    # Modifier l'en-tête si un logo est fourni et existe
-                    if logo_path and os.path.exists(logo_path):
-                        header = section.header
-                        for paragraph in header.paragraphs:
-                            paragraph.clear()
-                        if not header.paragraphs:
-                            header.add_paragraph()
-                        run = header.paragraphs[0].add_run()
-                        try:
-                            run.add_picture(logo_path, width=Inches(1.5))
-                        except Exception as e:
-                            print(f"⚠️ Erreur lors de l'ajout du logo : {str(e)}")
-                    
-                    # Modifier le pied de page si demandé
-                    if footer_text:
-                        footer = section.footer
-                        for paragraph in footer.paragraphs:
-                            paragraph.clear()
-                        if not footer.paragraphs:
-                            footer.add_paragraph()
-                        
-                        # Ajout d'espaces pour positionner le pied de page plus bas
-                        for _ in range(2):
-                            footer.add_paragraph()
-                        
-                        # Ajout du texte du pied de page
-                        last_paragraph = footer.paragraphs[-1]
-                        last_paragraph.text = footer_text
-                
-                doc.save(output_path)
+            # Ajouter le logo à la première feuille seulement
+            if index == 0 and logo_path and os.path.exists(logo_path):
+                try:
+                    img = Image(get_logo_asset(logo_path).stream())
+                    img.width = 150
+                    img.height = 75
+                    ws.add_image(img, "A1")
+                    report.logo_embedded = True
+                except Exception as e:
+                    print(f"⚠️ Erreur lors de l'ajout du logo dans Excel : {str(e)}")
+                    report.warnings.append(f"Logo non ajouté : {str(e)}")
             
-            # Nettoyer le fichier temporaire
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
-                
-        elif file_type == '.xlsx':
-            # Pour Excel, on va créer un fichier temporaire mais avec la bonne extension
-            temp_file = output_path + ".tmp.xlsx"
-            shutil.copy2(input_path, temp_file)
+            # Recopier les lignes au fil de l'eau en remplaçant les variables
+            for row in source_ws.iter_rows():
+                values = []
+                for cell in row:
+                    value = cell.value
+                    if isinstance(value, str):
+                        value = replacer(value)
+                    if getattr(cell, "has_style", False):
+                        # Styles recopiés par l'API publique, décodés une seule fois par style du template
+                        style_key = tuple(cell.style_array)
+                        style = styles.get(style_key)
+                        if style is None:
+                            style = styles[style_key] = (copy(cell.font), copy(cell.fill), copy(cell.border),
+                                                         copy(cell.alignment), copy(cell.protection),
+                                                         cell.number_format)
+                        written = WriteOnlyCell(ws, value)
+                        (written.font, written.fill, written.border,
+                         written.alignment, written.protection, written.number_format) = style
+                        values.append(written)
+                    else:
+                        values.append(value)
+                ws.append(values)
             
-            # Remplacer les variables dans le fichier Excel
+            # Ajouter le pied de page après une ligne vide
+            if footer_text:
+                ws.append([])
+                ws.append([footer_text])
+                report.footers_rewritten += 1
+        
+        wb.save(target)
+    finally:
+        source_wb.close()
+    report.add_substitutions(replacer.counts)
+    return report
+
+def render_xlsx(source, target, client_data, footer_text=None, logo_path=None):
+    """Traite un template Excel : un seul chargement, une seule sauvegarde"""
+    if XLSX_ENGINE == "stream":
+        try:
+            return rewrite_xlsx(source, target, client_data, footer_text,
+                                logo_path if logo_path and os.path.exists(logo_path) else None)
+        except UnsupportedPackageError as e:
+            print(f"⚠️ Moteur en flux indisponible pour ce classeur ({str(e)}), utilisation d'openpyxl")
+            _rewind(source, target)
+    
+    if xlsx_sheets_size(source) >= XLSX_STREAMING_THRESHOLD:
+        loss = xlsx_streaming_loss(source)
+        if loss is None:
             try:
-                import openpyxl
-                from openpyxl.drawing.image import Image
-                
-                wb = openpyxl.load_workbook(temp_file)
-                
-                # Parcourir toutes les feuilles
-                for sheet_name in wb.sheetnames:
-                    ws = wb[sheet_name]
-                    
-                    # Ajouter le logo à la première feuille seulement
-                    if sheet_name == wb.sheetnames[0] and logo_path and os.path.exists(logo_path):
-                        try:
-                            # Ajouter le logo dans la cellule A1
-                            img = Image(logo_path)
-                            # Redimensionner l'image
-                            img.width = 150
-                            img.height = 75
-                            ws.add_image(img, "A1")
-                        except Exception as e:
-                            print(f"⚠️ Erreur lors de l'ajout du logo dans Excel : {str(e)}")
-                    
-                    # Parcourir toutes les cellules pour remplacer les variables
-                    for row in ws.rows:
-                        for cell in row:
-                            if isinstance(cell.value, str):
-                                for key, value in client_data.items():
-                                    if f"«{key}»" in cell.value:
-                                        cell.value = cell.value.replace(f"«{key}»", str(value))
-                
-                # Ajouter le pied de page si fourni
-                if footer_text:
-                    for ws in wb.worksheets:
-                        try:
-                            # Excel n'a pas de pied de page facilement accessible via l'API
-                            # On ajoute un texte dans les dernières lignes de la première feuille
-                            last_row = ws.max_row + 2
-                            ws.cell(row=last_row, column=1).value = footer_text
-                        except Exception as e:
-                            print(f"⚠️ Erreur lors de l'ajout du pied de page dans Excel : {str(e)}")
-                
-                wb.save(output_path)
+                return render_xlsx_streaming(source, target, client_data, footer_text, logo_path)
             except Exception as e:
-                print(f"⚠️ Erreur lors du traitement du fichier Excel {input_path}: {str(e)}")
-                # En cas d'erreur, on copie simplement le fichier original
-                shutil.copy2(input_path, output_path)
-            
-            # Nettoyer le fichier temporaire
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
+                print(f"⚠️ Traitement en flux impossible ({str(e)}), chargement complet du classeur")
+                _rewind(source, target)
+        else:
+            # Le traitement ligne par ligne perdrait une partie du classeur : moteur XML, sinon chargement complet
+            print(f"ℹ️ Classeur volumineux avec {loss} : traitement ligne par ligne écarté")
+            if XLSX_ENGINE != "stream":
+                try:
+                    return rewrite_xlsx(source, target, client_data, footer_text,
+                                        logo_path if logo_path and os.path.exists(logo_path) else None)
+                except UnsupportedPackageError as e:
+                    print(f"⚠️ Moteur en flux indisponible pour ce classeur ({str(e)}), chargement complet")
+                    _rewind(source, target)
+    
+    report = ProcessingReport(engine="openpyxl")
+    try:
+        import openpyxl
+        from openpyxl.drawing.image import Image
         
-        elif file_type == '.pptx':
-            # Pour PowerPoint, on crée un fichier temporaire avec la bonne extension
-            temp_file = output_path + ".tmp.pptx"
-            shutil.copy2(input_path, temp_file)
+        wb = openpyxl.load_workbook(source)
+        replacer = PlaceholderReplacer(client_data)
+        
+        # Parcourir toutes les feuilles
+        for sheet_name in wb.sheetnames:
+            ws = wb[sheet_name]
+            replacer.part = sheet_name
+            
+            # Ajouter le logo à la première feuille seulement
+            if sheet_name == wb.sheetnames[0] and logo_path and os.path.exists(logo_path):
+                try:
+                    # Ajouter le logo dans la cellule A1
+                    img = Image(get_logo_asset(logo_path).stream())
+                    # Redimensionner l'image
+                    img.width = 150
+                    img.height = 75
+                    ws.add_image(img, "A1")
+                    report.logo_embedded = True
+                except Exception as e:
+                    print(f"⚠️ Erreur lors de l'ajout du logo dans Excel : {str(e)}")
+                    report.warnings.append(f"Logo non ajouté : {str(e)}")
             
+            # Parcourir toutes les cellules pour remplacer les variables
+            for row in ws.rows:
+                for cell in row:
+                    if isinstance(cell.value, str):
+                        new_value = replacer(cell.value)
+                        if new_value != cell.value:
+                            cell.value = new_value
+        
+        # Ajouter le pied de page si fourni
+        if footer_text:
+            for ws in wb.worksheets:
+                try:
+                    # Excel n'a pas de pied de page facilement accessible via l'API
+                    # On ajoute un texte dans les dernières lignes de la première feuille
+                    last_row = ws.max_row + 2
+                    ws.cell(row=last_row, column=1).value = footer_text
+                    report.footers_rewritten += 1
+                except Exception as e:
+                    print(f"⚠️ Erreur lors de l'ajout du pied de page dans Excel : {str(e)}")
+                    report.warnings.append(f"Pied de page non ajouté ({ws.title}) : {str(e)}")
+        
+        wb.save(target)
+        report.add_substitutions(replacer.counts)
+        return report
+    except Exception as e:
+        print(f"⚠️ Erreur lors du traitement du fichier Excel : {str(e)}")
+        # En cas d'erreur, on copie simplement le fichier original
+        _copy_source(source, target)
+        return ProcessingReport(engine="copie", warnings=[f"Fichier copié sans traitement : {str(e)}"])
+
+def iter_pptx_parts(prs):
+    """Parcourt chaque partie de la présentation contenant des formes, une seule fois :
+    masques, dispositions, diapositives et pages de notes existantes.
+    
+    Retourne des couples (nom de la partie, formes).
+    """
+    for master in prs.slide_masters:
+        yield _part_name(master.part), master.shapes
+        for layout in master.slide_layouts:
+            yield _part_name(layout.part), layout.shapes
+    for slide in prs.slides:
+        yield _part_name(slide.part), slide.shapes
+        # has_notes_slide évite de créer une page de notes vide pour chaque diapositive
+        if slide.has_notes_slide:
+            notes_slide = slide.notes_slide
+            yield _part_name(notes_slide.part), notes_slide.shapes
+
+def iter_pptx_text_frames(shapes):
+    """Parcourt les zones de texte de formes PowerPoint, groupes et cellules de tableaux compris"""
+    from pptx.enum.shapes import MSO_SHAPE_TYPE
+    
+    for shape in shapes:
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            yield from iter_pptx_text_frames(shape.shapes)
+        elif shape.has_text_frame:
+            yield shape.text_frame
+        elif getattr(shape, "has_table", False):
+            for row in shape.table.rows:
+                for cell in row.cells:
+                    yield cell.text_frame
+
+def replace_in_runs(paragraphs, replacer):
+    """Remplace les variables run par run : seuls les runs contenant une variable sont modifiés,
+    la mise en forme des autres est conservée"""
+    for paragraph in paragraphs:
+        runs = paragraph.runs
+        replaced = replacer.replace_segments([run.text for run in runs])
+        if replaced is None:
+            continue
+        for run, text in zip(runs, replaced):
+            if run.text != text:
+                run.text = text
+
+def replace_variables_in_pptx(prs, replacer):
+    """Remplace les variables dans une présentation déjà chargée, en un seul parcours"""
+    for part_name, shapes in iter_pptx_parts(prs):
+        replacer.part = part_name
+        for text_frame in iter_pptx_text_frames(shapes):
+            replace_in_runs(text_frame.paragraphs, replacer)
+
+def _editable_shapes(owner):
+    """Arbre de formes d'un masque ou d'une disposition avec add_picture / add_textbox.
+    
+    python-pptx ne les expose que pour les diapositives : l'arbre est relu par ses attributs
+    internes, ce qui est vérifié avant utilisation.
+    """
+    from pptx.shapes.shapetree import SlideShapes
+    
+    shapes = SlideShapes(owner.shapes._spTree, owner)
+    if not (callable(getattr(shapes, "add_picture", None)) and callable(getattr(shapes, "add_textbox", None))):
+        raise AttributeError("add_picture / add_textbox indisponibles")
+    return shapes
+
+def pptx_decoration_targets(prs, mode=None):
+    """Formes auxquelles ajouter le logo et le pied de page, selon PPTX_DECORATION.
+    
+    Retourne des couples (description, formes) : chaque diapositive, chaque masque, ou chaque
+    disposition utilisée par au moins une diapositive. Les formes d'un masque ou d'une
+    disposition sont héritées par les diapositives qui l'utilisent. Si la version de
+    python-pptx ne permet pas de modifier masques et dispositions, chaque diapositive est décorée.
+    """
+    mode = mode or PPTX_DECORATION
+    try:
+        if mode == "master":
+            return [(f"masque {index}", _editable_shapes(master))
+                    for index, master in enumerate(prs.slide_masters, start=1)]
+        if mode == "layouts":
+            layouts = {}
+            for slide in prs.slides:
+                layout = slide.slide_layout
+                layouts.setdefault(layout.part.partname, layout)
+            return [(f"disposition « {layout.name} »", _editable_shapes(layout))
+                    for layout in layouts.values()]
+    except (ImportError, AttributeError, TypeError) as e:
+        print(f"⚠️ Masques et dispositions non modifiables avec cette version de python-pptx "
+              f"({str(e)}), logo et pied de page ajoutés sur chaque diapositive")
+    return [(f"diapositive {index}", slide.shapes) for index, slide in enumerate(prs.slides, start=1)]
+
+def render_pptx(source, target, client_data, footer_text=None, logo_path=None):
+    """Traite un template PowerPoint : un seul chargement, une seule sauvegarde"""
+    try:
+        from pptx import Presentation
+        from pptx.util import Inches
+        
+        # Charger la présentation
+        prs = Presentation(source)
+        replacer = PlaceholderReplacer(client_data)
+        report = ProcessingReport(engine="python-pptx")
+        
+        # Remplacer les variables run par run dans toutes les parties de la présentation
+        replace_variables_in_pptx(prs, replacer)
+        
+        # Diapositives, masques ou dispositions utilisées qui reçoivent le logo et le pied de page
+        targets = pptx_decoration_targets(prs)
+        
+        # Ajouter le logo
+        if logo_path and os.path.exists(logo_path):
             try:
-                from pptx import Presentation
-                from pptx.util import Inches
-                
-                # Charger la présentation
-                prs = Presentation(temp_file)
-                
-                # Ajouter le logo à toutes les diapositives
-                if logo_path and os.path.exists(logo_path):
-                    try:
-                        for slide in prs.slides:
-                            # Ajouter le logo en haut à gauche
-                            left = Inches(0.5)
-                            top = Inches(0.5)
-                            width = Inches(1.5)
-                            slide.shapes.add_picture(logo_path, left, top, width=width)
-                    except Exception as e:
-                        print(f"⚠️ Erreur lors de l'ajout du logo dans PowerPoint : {str(e)}")
-                
-                # Parcourir toutes les diapositives
-                for slide in prs.slides:
-                    # Parcourir tous les shapes (zones de texte, etc.)
-                    for shape in slide.shapes:
-                        if hasattr(shape, "text"):
-                            # Remplacer les variables dans le texte
-                            text = shape.text
-                            for key, value in client_data.items():
-                                if f"«{key}»" in text:
-                                    text = text.replace(f"«{key}»", str(value))
-                            shape.text = text
-                    
-                    # Ajouter le pied de page sur chaque diapositive
-                    if footer_text:
-                        try:
-                            # Dimensions de la diapositive
-                            slide_width = prs.slide_width
-                            slide_height = prs.slide_height
-                            
-                            # Ajouter une zone de texte pour le pied de page
-                            left = Inches(0.5)
-                            top = slide_height - Inches(1)
-                            width = slide_width - Inches(1)
-                            height = Inches(0.8)
-                            
-                            textbox = slide.shapes.add_textbox(left, top, width, height)
-                            textbox.text = footer_text
-                            textbox.text_frame.paragraphs[0].font.size = Inches(0.1)
-                        except Exception as e:
-                            print(f"⚠️ Erreur lors de l'ajout du pied de page dans PowerPoint : {str(e)}")
-                
-                # Sauvegarder la présentation
-                prs.save(output_path)
+                # Logo préparé une seule fois : toutes les parties partagent la même image
+                logo = get_logo_asset(logo_path)
+                for _, shapes in targets:
+                    # Ajouter le logo en haut à gauche
+                    left = Inches(0.5)
+                    top = Inches(0.5)
+                    width = Inches(1.5)
+                    shapes.add_picture(logo.stream(), left, top, width=width)
+                report.logo_embedded = len(targets) > 0
             except Exception as e:
-                print(f"⚠️ Erreur lors du traitement du fichier PowerPoint {input_path}: {str(e)}")
-                # En cas d'erreur, on garde la copie simple
-                shutil.copy2(input_path, output_path)
-            
-            # Nettoyer le fichier temporaire
-            if os.path.exists(temp_file):
-                os.remove(temp_file)
+                print(f"⚠️ Erreur lors de l'ajout du logo dans PowerPoint : {str(e)}")
+                report.warnings.append(f"Logo non ajouté : {str(e)}")
         
-        else:
-            # Pour les autres types de fichiers, faire une copie simple
-            shutil.copy2(input_path, output_path)
-            
+        # Ajouter le pied de page
+        if footer_text:
+            for description, shapes in targets:
+                try:
+                    # Dimensions de la diapositive
+                    slide_width = prs.slide_width
+                    slide_height = prs.slide_height
+                    
+                    # Ajouter une zone de texte pour le pied de page
+                    left = Inches(0.5)
+                    top = slide_height - Inches(1)
+                    width = slide_width - Inches(1)
+                    height = Inches(0.8)
+                    
+                    textbox = shapes.add_textbox(left, top, width, height)
+                    textbox.text = footer_text
+                    textbox.text_frame.paragraphs[0].font.size = Inches(0.1)
+                    report.footers_rewritten += 1
+                except Exception as e:
+                    print(f"⚠️ Erreur lors de l'ajout du pied de page dans PowerPoint : {str(e)}")
+                    report.warnings.append(f"Pied de page non ajouté ({description}) : {str(e)}")
+        
+        # Sauvegarder la présentation
+        prs.save(target)
+        report.add_substitutions(replacer.counts)
+        return report
+    except Exception as e:
+        print(f"⚠️ Erreur lors du traitement du fichier PowerPoint : {str(e)}")
+        # En cas d'erreur, on garde la copie simple
+        _copy_source(source, target)
+        return ProcessingReport(engine="copie", warnings=[f"Fichier copié sans traitement : {str(e)}"])
+
+# Traitement des templates client par extension
+TEMPLATE_RENDERERS = {
+    '.docx': render_docx,
+    '.xlsx': render_xlsx,
+    '.pptx': render_pptx
+}
+
+def render_template(source, target, file_type, client_data, footer_text=None, logo_path=None):
+    """Traite un template client ; source et cible sont des chemins ou des flux binaires.
+    
+    Retourne le rapport de traitement (ProcessingReport) du fichier.
+    """
+    renderer = TEMPLATE_RENDERERS.get(file_type)
+    if renderer is None:
+        # Pour les autres types de fichiers, faire une copie simple
+        _copy_source(source, target)
+        return ProcessingReport(engine="copie")
+    return renderer(source, target, client_data, footer_text, logo_path)
+
+def render_template_result(data, file_type, client_data, footer_text=None, logo_path=None):
+    """Traite un template client en mémoire et retourne (octets produits, rapport de traitement).
+    
+    Un rendu identique (même template, mêmes données, même logo, même pied de page)
+    est relu depuis le cache des sorties sans recharger le document.
+    """
+    key = output_key(data, file_type, client_data, footer_text, logo_path, _engine_tag("template"))
+    cached = get_cached_output(key)
+    if cached is not None:
+        metadata = get_cached_metadata(key)
+        report = ProcessingReport.from_dict(metadata) if metadata else ProcessingReport(
+            bytes_in=len(data), bytes_out=len(cached))
+        report.from_cache = True
+        return cached, report
+    output = BytesIO()
+    report = render_template(BytesIO(data), output, file_type, client_data, footer_text, logo_path)
+    result = output.getvalue()
+    report.bytes_in = len(data)
+    report.bytes_out = len(result)
+    store_output(key, result, report.to_dict())
+    return result, report
+
+def render_template_bytes(data, file_type, client_data, footer_text=None, logo_path=None):
+    """Traite un template client en mémoire : octets en entrée, octets en sortie"""
+    return render_template_result(data, file_type, client_data, footer_text, logo_path)[0]
+
+def process_client_template(input_path, output_path, file_type, client_data, footer_text=None, logo_path=None):
+    """Traite un template client selon son type"""
+    try:
+        output = render_template_bytes(Path(input_path).read_bytes(), file_type, client_data, footer_text, logo_path)
+        Path(output_path).write_bytes(output)
         return True
     except Exception as e:
         print(f"❌ Erreur lors du traitement de {input_path}: {str(e)}")
         return False
 
+_process_pool = None
+
+def get_process_pool():
+    """Retourne le pool de processus partagé, créé au premier appel"""
+    global _process_pool
+    if _process_pool is None:
+        # "spawn" : les processus ne dupliquent pas les threads du serveur Streamlit
+        _process_pool = ProcessPoolExecutor(
+            max_workers=MAX_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _process_pool
+
+def reset_process_pool():
+    """Abandonne le pool courant (par exemple après l'arrêt brutal d'un processus)"""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+def process_files(jobs, function=process_file):
+    """Traite des fichiers en parallèle dans le pool de processus.
+    
+    jobs : liste de tuples (input_path, output_path, file_type, footer_text[, logo_path])
+    function : traitement appliqué à chaque fichier (process_file ou refresh_file)
+    Les résultats sont produits dès qu'ils sont prêts : (job, succès). L'échec d'un
+    fichier n'interrompt pas le traitement des autres.
+    """
+    pool = get_process_pool()
+    futures = {pool.submit(function, *job): job for job in jobs}
+    broken = False
+    for future in as_completed(futures):
+        job = futures[future]
+        try:
+            success = future.result()
+        except BrokenProcessPool:
+            broken = True
+            success = False
+        except Exception as e:
+            print(f"❌ Erreur lors du traitement de {job[0]}: {str(e)}")
+            success = False
+        yield job, success
+    if broken:
+        reset_process_pool()
+
+def safe_folder_name(name):
+    """Nom de dossier utilisable sur tous les systèmes à partir d'un nom de client"""
+    cleaned = re.sub(r'[<>:"/\\|?*\x00-\x1f]', "_", str(name)).strip(" .")
+    return cleaned or "client"
+
+def generate_for_clients(templates, clients, output_folder):
+    """Génère chaque template pour chaque client en parallèle.
+    
+    templates : liste de chemins de templates
+    clients : liste de dictionnaires (name, data, footer_text, logo_path)
+    Les résultats sont produits au fur et à mesure : (nom du client, nom du fichier, succès)
+    """
+    pool = get_process_pool()
+    futures = {}
+    used_folders = set()
+    for client in clients:
+        folder_name = safe_folder_name(client["name"])
+        while folder_name in used_folders:
+            folder_name += "_"
+        used_folders.add(folder_name)
+        client_folder = os.path.join(output_folder, folder_name)
+        os.makedirs(client_folder, exist_ok=True)
+        
+        logo_path = client.get("logo_path")
+        if logo_path and not os.path.exists(logo_path):
+            logo_path = None
+        
+        for template_path in templates:
+            file_name = os.path.basename(template_path)
+            future = pool.submit(
+                process_client_template,
+                template_path,
+                os.path.join(client_folder, file_name),
+                os.path.splitext(file_name)[1].lower(),
+                client["data"],
+                client.get("footer_text"),
+                logo_path
+            )
+            futures[future] = (client["name"], folder_name, file_name)
+    
+    for future in as_completed(futures):
+        client_name, folder_name, file_name = futures[future]
+        try:
+            success = future.result()
+        except Exception as e:
+            print(f"❌ Erreur lors du traitement de {file_name} pour {client_name}: {str(e)}")
+            success = False
+        yield client_name, os.path.join(folder_name, file_name), success
+
 # Création des dossiers nécessaires
 for folder in [INPUT_FOLDER, OUTPUT_FOLDER, PDF_OUTPUT_FOLDER]:
     os.makedirs(folder, exist_ok=True)
 
-# ... reste du code ...
\ No newline at end of file
+# Journal des fichiers traités par le traitement en lot, dans le dossier de sortie
+BATCH_MANIFEST_NAME = ".placeandreplace_manifest.jsonl"
+
+def iter_batch_files(input_dir):
+    """Parcourt l'arborescence d'entrée (ordre stable) et retourne les chemins relatifs des fichiers supportés"""
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if Path(name).suffix.lower() in SUPPORTED_EXTENSIONS and not name.startswith("~$"):
+                yield os.path.relpath(os.path.join(root, name), input_dir)
+
+def batch_settings_key(footer_text, logo_path):
+    """Empreinte des réglages d'un traitement en lot : un fichier déjà traité avec d'autres
+    réglages (pied de page, logo, version du moteur) est retraité à la reprise"""
+    digest = hashlib.sha256(_engine_tag("batch").encode("utf-8"))
+    digest.update(hashlib.sha256((footer_text or "").encode("utf-8")).digest())
+    if logo_path and os.path.exists(logo_path):
+        with open(logo_path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+def load_batch_manifest(manifest_path, settings):
+    """Fichiers déjà traités avec succès avec les mêmes réglages : chemin relatif -> (taille, date)"""
+    done = {}
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Dernière ligne incomplète d'un traitement interrompu
+                    continue
+                if entry.get("settings") != settings:
+                    continue
+                if entry.get("ok"):
+                    done[entry["path"]] = (entry["size"], entry["mtime_ns"])
+                else:
+                    done.pop(entry["path"], None)
+    except FileNotFoundError:
+        pass
+    return done
+
+def run_batch(input_dir, output_dir, footer_text, logo_path=None, manifest_path=None, restart=False):
+    """Traite toute une arborescence en parallèle vers une arborescence de sortie identique.
+    
+    Chaque fichier terminé est ajouté au journal (manifest) : un traitement interrompu
+    reprend là où il s'était arrêté. Retourne (traités, ignorés, échecs).
+    """
+    manifest_path = manifest_path or os.path.join(output_dir, BATCH_MANIFEST_NAME)
+    logo_path = logo_path or LOGO_PATH
+    settings = batch_settings_key(footer_text, logo_path)
+    done = {} if restart else load_batch_manifest(manifest_path, settings)
+    
+    jobs = []
+    signatures = {}
+    skipped = 0
+    for relative_path in iter_batch_files(input_dir):
+        input_path = os.path.join(input_dir, relative_path)
+        output_path = os.path.join(output_dir, relative_path)
+        signature = _file_signature(input_path)
+        if done.get(relative_path) == signature and os.path.exists(output_path):
+            skipped += 1
+            continue
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        signatures[input_path] = (relative_path, signature)
+        jobs.append((input_path, output_path, Path(relative_path).suffix.lower(), footer_text, logo_path))
+    
+    print(f"📁 {len(jobs)} fichier(s) à traiter, {skipped} déjà traité(s)")
+    processed = failed = 0
+    started = time.monotonic()
+    os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+    with open(manifest_path, "w" if restart else "a", encoding="utf-8") as manifest:
+        for index, (job, success) in enumerate(process_files(jobs), start=1):
+            relative_path, (size, mtime_ns) = signatures[job[0]]
+            manifest.write(json.dumps({"path": relative_path, "size": size, "mtime_ns": mtime_ns,
+                                       "settings": settings, "ok": success}, ensure_ascii=False) + "\n")
+            # Chaque ligne est écrite dès la fin du fichier : un arrêt brutal ne perd que les fichiers en cours
+            manifest.flush()
+            if success:
+                processed += 1
+            else:
+                failed += 1
+            if index % 100 == 0 or index == len(jobs):
+                rate = index / max(time.monotonic() - started, 1e-6)
+                print(f"⏳ {index}/{len(jobs)} ({rate:.1f} fichiers/s)")
+    return processed, skipped, failed
+
+def main(argv=None):
+    """Traitement en lot en ligne de commande"""
+    global MAX_WORKERS, LOGO_PATH
+    parser = argparse.ArgumentParser(
+        description="Ajoute le logo et le pied de page à tous les documents d'une arborescence"
+    )
+    parser.add_argument("input_dir", nargs="?", default=INPUT_FOLDER, help="Dossier des documents à traiter")
+    parser.add_argument("output_dir", nargs="?", default=OUTPUT_FOLDER, help="Dossier de sortie (même arborescence)")
+    parser.add_argument("-j", "--workers", type=int, default=MAX_WORKERS, help="Nombre de processus de traitement")
+    parser.add_argument("--footer", help="Texte du pied de page (par défaut : footer.txt)")
+    parser.add_argument("--logo", default=LOGO_PATH, help="Logo à intégrer")
+    parser.add_argument("--manifest", help=f"Journal de reprise (par défaut : <sortie>/{BATCH_MANIFEST_NAME})")
+    parser.add_argument("--restart", action="store_true", help="Ignore le journal et retraite tous les fichiers")
+    args = parser.parse_args(argv)
+    
+    if not os.path.isdir(args.input_dir):
+        parser.error(f"Dossier introuvable : {args.input_dir}")
+    input_dir = os.path.abspath(args.input_dir)
+    output_dir = os.path.abspath(args.output_dir)
+    if output_dir == input_dir or output_dir.startswith(input_dir + os.sep):
+        parser.error("Le dossier de sortie ne doit pas se trouver dans le dossier d'entrée")
+    footer_text = args.footer if args.footer is not None else get_footer_text()
+    
+    # Réglages transmis aux processus de traitement, qui relisent la configuration au démarrage
+    MAX_WORKERS = max(1, args.workers)
+    LOGO_PATH = os.path.abspath(args.logo)
+    os.environ["LOGO_PATH"] = LOGO_PATH
+    reset_process_pool()
+    
+    try:
+        processed, skipped, failed = run_batch(input_dir, output_dir, footer_text, LOGO_PATH,
+                                               args.manifest, args.restart)
+    except KeyboardInterrupt:
+        print("⏹️ Traitement interrompu : relancer la même commande pour reprendre")
+        reset_process_pool()
+        return 130
+    print(f"✅ {processed} traité(s), {skipped} ignoré(s), {failed} échec(s)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,369 @@
+import argparse
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import select
+import signal
+import struct
+import sys
+import tempfile
+import time
+from concurrent.futures import BrokenExecutor
+from pathlib import Path
+
+import replace_header_footer
+from replace_header_footer import (
+    INPUT_FOLDER,
+    OUTPUT_FOLDER,
+    SUPPORTED_EXTENSIONS,
+    batch_settings_key,
+    get_footer_text,
+    get_process_pool,
+    process_file,
+    reset_process_pool,
+)
+
+# Délai sans nouvel événement avant de traiter un fichier (secondes) : les fichiers
+# en cours d'écriture ou de copie ne sont pas traités à moitié
+WATCH_DEBOUNCE = float(os.environ.get("WATCH_DEBOUNCE", "2"))
+# Index des fichiers déjà traités (empreinte du contenu et des réglages), dans le dossier de sortie
+WATCH_INDEX_NAME = ".placeandreplace_index.json"
+# Intervalle minimal entre deux sauvegardes de l'index (secondes)
+INDEX_SAVE_INTERVAL = 5
+
+# Constantes inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+# Fichiers temporaires d'Office, de navigateurs et d'outils de copie
+IGNORED_PREFIXES = ("~$", ".")
+IGNORED_SUFFIXES = (".tmp", ".part", ".crdownload")
+
+
+class Inotify:
+    """Surveillance d'une arborescence par inotify, via la libc (sans dépendance)"""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"inotify indisponible : {os.strerror(error)}")
+        # Identifiant de surveillance -> dossier surveillé
+        self.folders = {}
+
+    def add_watch(self, folder):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(folder), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"Impossible de surveiller {folder} : {os.strerror(error)}")
+        self.folders[wd] = folder
+
+    def add_tree(self, root):
+        """Surveille un dossier et tous ses sous-dossiers ; retourne les dossiers ajoutés"""
+        added = []
+        for folder, dirs, _ in os.walk(root):
+            dirs[:] = [name for name in dirs if not name.startswith(IGNORED_PREFIXES)]
+            try:
+                self.add_watch(folder)
+                added.append(folder)
+            except OSError as e:
+                print(f"⚠️ {str(e)}")
+        return added
+
+    def read_events(self, timeout):
+        """Attend au plus `timeout` secondes et retourne les événements : (chemin, masque)"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, mask))
+                continue
+            folder = self.folders.get(wd)
+            if mask & IN_IGNORED:
+                self.folders.pop(wd, None)
+                continue
+            if folder is None:
+                continue
+            events.append((os.path.join(folder, os.fsdecode(name)) if name else folder, mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def is_watched_file(path):
+    name = os.path.basename(path)
+    return (Path(name).suffix.lower() in SUPPORTED_EXTENSIONS
+            and not name.startswith(IGNORED_PREFIXES) and not name.endswith(IGNORED_SUFFIXES))
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def load_index(index_path):
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_index(index_path, index):
+    # Écriture atomique : un arrêt brutal laisse l'index précédent intact
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(index_path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(temp_path, index_path)
+
+
+class FolderWatcher:
+    """Traite au fil de l'eau les documents déposés dans le dossier d'entrée.
+
+    Un fichier est traité lorsqu'il n'a plus changé pendant WATCH_DEBOUNCE secondes ;
+    il est ignoré si son contenu et les réglages (pied de page, logo) sont ceux du dernier
+    traitement réussi. Au plus `max_in_flight` fichiers sont confiés au pool à la fois.
+    """
+
+    def __init__(self, input_dir, output_dir, index_path=None, debounce=WATCH_DEBOUNCE, max_in_flight=None,
+                 logo_path=None):
+        self.input_dir = os.path.abspath(input_dir)
+        self.output_dir = os.path.abspath(output_dir)
+        self.index_path = index_path or os.path.join(self.output_dir, WATCH_INDEX_NAME)
+        self.debounce = debounce
+        self.max_in_flight = max_in_flight or 2 * replace_header_footer.MAX_WORKERS
+        # Logo transmis à chaque traitement (par défaut : LOGO_PATH)
+        self.logo_path = logo_path
+        self.index = load_index(self.index_path)
+        self.index_dirty = False
+        self.index_saved_at = time.monotonic()
+        # Fichiers en attente : chemin -> (échéance, taille et date au dernier événement)
+        self.pending = {}
+        # Traitements en cours : future -> (chemin, sortie, empreinte, réglages, taille et date)
+        self.in_flight = {}
+        self.running = True
+
+    def _relative(self, path):
+        return os.path.relpath(path, self.input_dir)
+
+    def schedule(self, path, delay=None):
+        try:
+            signature = _signature(path)
+        except OSError:
+            # Supprimé ou renommé entre-temps
+            self.pending.pop(path, None)
+            return
+        self.pending[path] = (time.monotonic() + (self.debounce if delay is None else delay), signature)
+
+    def scan(self, folder):
+        """Met en attente les fichiers existants d'un dossier (démarrage, nouveau dossier, débordement)"""
+        for root, dirs, files in os.walk(folder):
+            dirs[:] = [name for name in dirs if not name.startswith(IGNORED_PREFIXES)]
+            for name in files:
+                path = os.path.join(root, name)
+                if is_watched_file(path):
+                    self.schedule(path, delay=0)
+
+    def handle_event(self, inotify, path, mask):
+        if path is None:
+            # File d'événements du noyau saturée : des événements ont été perdus
+            print("⚠️ Événements perdus, nouveau parcours du dossier d'entrée")
+            inotify.add_tree(self.input_dir)
+            self.scan(self.input_dir)
+        elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            if path == self.input_dir:
+                print("❌ Le dossier d'entrée a été supprimé ou déplacé")
+                self.running = False
+        elif mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO) and not os.path.basename(path).startswith(IGNORED_PREFIXES):
+                # Les fichiers créés avant la mise en place de la surveillance ne génèrent pas d'événement
+                inotify.add_tree(path)
+                self.scan(path)
+        elif is_watched_file(path):
+            self.schedule(path)
+
+    def _up_to_date(self, relative_path, signature, settings, output_path):
+        entry = self.index.get(relative_path)
+        if not entry or entry.get("settings") != settings or not os.path.exists(output_path):
+            return False, None
+        if (entry.get("size"), entry.get("mtime_ns")) == signature:
+            return True, entry["sha256"]
+        digest = file_digest(os.path.join(self.input_dir, relative_path))
+        return digest == entry.get("sha256"), digest
+
+    def submit_ready(self):
+        now = time.monotonic()
+        busy = {path for path, *_ in self.in_flight.values()}
+        footer_text = None
+        logo_path = None
+        settings = None
+        for path, (deadline, signature) in sorted(self.pending.items(), key=lambda item: item[1][0]):
+            if len(self.in_flight) >= self.max_in_flight:
+                break
+            if deadline > now or path in busy:
+                continue
+            try:
+                current = _signature(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            if current != signature:
+                # Toujours en cours d'écriture (par exemple sur un partage réseau sans événements)
+                self.pending[path] = (now + self.debounce, current)
+                continue
+            del self.pending[path]
+
+            if settings is None:
+                # Réglages relus une fois par cycle : un pied de page ou un logo modifié s'applique aux fichiers suivants
+                footer_text = get_footer_text()
+                logo_path = self.logo_path or replace_header_footer.LOGO_PATH
+                settings = batch_settings_key(footer_text, logo_path)
+            relative_path = self._relative(path)
+            output_path = os.path.join(self.output_dir, relative_path)
+            try:
+                up_to_date, digest = self._up_to_date(relative_path, current, settings, output_path)
+                if up_to_date:
+                    continue
+                digest = digest or file_digest(path)
+            except OSError:
+                continue
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            future = get_process_pool().submit(
+                process_file, path, output_path, Path(path).suffix.lower(), footer_text, logo_path)
+            self.in_flight[future] = (path, output_path, digest, settings, current)
+
+    def collect_done(self):
+        for future in [future for future in self.in_flight if future.done()]:
+            path, output_path, digest, settings, (size, mtime_ns) = self.in_flight.pop(future)
+            try:
+                success = future.result()
+            except BrokenExecutor:
+                # Processus de traitement arrêté brutalement : nouveau pool, fichier remis en attente
+                reset_process_pool()
+                success = False
+                self.schedule(path)
+            except Exception as e:
+                print(f"❌ Erreur lors du traitement de {path}: {str(e)}")
+                success = False
+            # Seul un fichier dont la sortie existe est marqué comme traité
+            if success and os.path.exists(output_path):
+                self.index[self._relative(path)] = {"sha256": digest, "settings": settings,
+                                                    "size": size, "mtime_ns": mtime_ns}
+                self.index_dirty = True
+                print(f"✓ {self._relative(path)}")
+        if self.index_dirty and (not self.running or time.monotonic() - self.index_saved_at >= INDEX_SAVE_INTERVAL):
+            self.flush_index()
+
+    def flush_index(self):
+        if self.index_dirty:
+            save_index(self.index_path, self.index)
+            self.index_dirty = False
+        self.index_saved_at = time.monotonic()
+
+    def stop(self, *_):
+        self.running = False
+
+    def run(self, initial_scan=True):
+        inotify = Inotify()
+        try:
+            # Surveillance mise en place avant le parcours initial : aucun dépôt n'est manqué
+            folders = inotify.add_tree(self.input_dir)
+            print(f"👀 Surveillance de {self.input_dir} ({len(folders)} dossier(s))")
+            if initial_scan:
+                self.scan(self.input_dir)
+            while self.running:
+                # Réveil à la prochaine échéance, ou régulièrement tant que des traitements sont en cours
+                timeout = 1.0
+                if self.pending:
+                    timeout = min(timeout, max(0.0, min(deadline for deadline, _ in self.pending.values())
+                                               - time.monotonic()))
+                if self.in_flight:
+                    timeout = min(timeout, 0.1)
+                try:
+                    events = inotify.read_events(timeout)
+                except InterruptedError:
+                    events = []
+                for path, mask in events:
+                    self.handle_event(inotify, path, mask)
+                self.collect_done()
+                self.submit_ready()
+            # Arrêt : les traitements en cours sont terminés et enregistrés dans l'index
+            while self.in_flight:
+                time.sleep(0.1)
+                self.collect_done()
+        finally:
+            self.flush_index()
+            inotify.close()
+
+
+def main(argv=None):
+    """Surveille le dossier d'entrée et traite les nouveaux documents"""
+    parser = argparse.ArgumentParser(description="Traite au fil de l'eau les documents déposés dans un dossier")
+    parser.add_argument("input_dir", nargs="?", default=INPUT_FOLDER, help="Dossier surveillé")
+    parser.add_argument("output_dir", nargs="?", default=OUTPUT_FOLDER, help="Dossier de sortie (même arborescence)")
+    parser.add_argument("-j", "--workers", type=int, default=replace_header_footer.MAX_WORKERS,
+                        help="Nombre de processus de traitement")
+    parser.add_argument("--debounce", type=float, default=WATCH_DEBOUNCE,
+                        help="Secondes sans modification avant de traiter un fichier")
+    parser.add_argument("--index", help=f"Index des fichiers traités (par défaut : <sortie>/{WATCH_INDEX_NAME})")
+    parser.add_argument("--no-initial-scan", action="store_true",
+                        help="Ne traite que les fichiers déposés après le démarrage")
+    args = parser.parse_args(argv)
+
+    if not sys.platform.startswith("linux"):
+        parser.error("La surveillance de dossier utilise inotify et nécessite Linux")
+    input_dir = os.path.abspath(args.input_dir)
+    output_dir = os.path.abspath(args.output_dir)
+    if not os.path.isdir(input_dir):
+        parser.error(f"Dossier introuvable : {args.input_dir}")
+    if output_dir == input_dir or output_dir.startswith(input_dir + os.sep):
+        parser.error("Le dossier de sortie ne doit pas se trouver dans le dossier surveillé")
+
+    replace_header_footer.MAX_WORKERS = max(1, args.workers)
+    watcher = FolderWatcher(input_dir, output_dir, args.index, args.debounce)
+    signal.signal(signal.SIGTERM, watcher.stop)
+    signal.signal(signal.SIGINT, watcher.stop)
+    watcher.run(initial_scan=not args.no_initial_scan)
+    reset_process_pool()
+    print("⏹️ Surveillance arrêtée")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+from replace_header_footer import LOGO_PATH
+
+
+def _default_root():
+    # tmpfs (/dev/shm) lorsqu'il est disponible : les fichiers de travail ne touchent pas le disque
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return os.path.join("/dev/shm", "placeandreplace")
+    return os.path.join(tempfile.gettempdir(), "placeandreplace_workspaces")
+
+
+# Dossier contenant un espace de travail par session
+WORKSPACE_ROOT = os.environ.get("WORKSPACE_ROOT") or _default_root()
+# Espace disque maximal d'une session (Mo)
+WORKSPACE_QUOTA_BYTES = int(os.environ.get("WORKSPACE_QUOTA_MB", "500")) * 1024 * 1024
+# Durée d'inactivité (minutes) après laquelle l'espace d'une session abandonnée est supprimé
+WORKSPACE_TTL = int(os.environ.get("WORKSPACE_TTL_MINUTES", "120")) * 60
+# Intervalle minimal entre deux nettoyages des espaces abandonnés (secondes)
+WORKSPACE_GC_INTERVAL = 60
+
+# Fichier dont la date de modification marque la dernière activité de la session
+LAST_SEEN_NAME = ".last_seen"
+
+
+class QuotaExceededError(Exception):
+    """L'espace de travail de la session est plein"""
+
+
+@dataclass
+class Workspace:
+    """Dossiers de travail d'une session : documents, sorties, PDF, logo et fichiers temporaires"""
+    session_id: str
+    root: str
+    # Vrai si l'espace vient d'être créé (nouvelle session, ou session expirée puis nettoyée)
+    created: bool = False
+
+    @property
+    def input_folder(self):
+        return os.path.join(self.root, "input")
+
+    @property
+    def output_folder(self):
+        return os.path.join(self.root, "output")
+
+    @property
+    def pdf_folder(self):
+        return os.path.join(self.root, "pdf")
+
+    @property
+    def temp_folder(self):
+        return os.path.join(self.root, "temp")
+
+    @property
+    def session_logo_path(self):
+        return os.path.join(self.root, "logo")
+
+    @property
+    def logo_path(self):
+        """Logo de la session s'il a été changé, sinon le logo par défaut"""
+        return self.session_logo_path if os.path.exists(self.session_logo_path) else LOGO_PATH
+
+    def touch(self):
+        with open(os.path.join(self.root, LAST_SEEN_NAME), "a"):
+            pass
+        os.utime(os.path.join(self.root, LAST_SEEN_NAME))
+
+    def usage(self):
+        """Espace disque occupé par la session (octets)"""
+        total = 0
+        for folder, _, files in os.walk(self.root):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(folder, name)).st_size
+                except OSError:
+                    pass
+        return total
+
+    def ensure_space(self, size):
+        """Vérifie que `size` octets supplémentaires tiennent dans le quota de la session"""
+        used = self.usage()
+        if used + size > WORKSPACE_QUOTA_BYTES:
+            raise QuotaExceededError(
+                f"Espace de travail plein : {(used + size) / 1024 / 1024:.1f} Mo nécessaires "
+                f"pour {WORKSPACE_QUOTA_BYTES / 1024 / 1024:.0f} Mo autorisés"
+            )
+
+    def ensure_output_space(self, sources, replaced=()):
+        """Vérifie avant un traitement que des sorties de la taille des fichiers `sources` tiennent
+        dans le quota, déduction faite des fichiers `replaced` qu'elles remplacent"""
+        self.ensure_space(max(0, _files_size(sources) - _files_size(replaced)))
+
+    def write_file(self, folder, name, data):
+        """Écrit un fichier dans un dossier de la session, dans la limite du quota"""
+        self.ensure_space(len(data))
+        path = os.path.join(folder, os.path.basename(name))
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def save_logo(self, data):
+        """Enregistre le logo de la session ; retourne False s'il est identique au logo actuel"""
+        path = self.session_logo_path
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                if hashlib.sha256(f.read()).digest() == hashlib.sha256(data).digest():
+                    return False
+        self.write_file(self.root, "logo", data)
+        return True
+
+    def make_temp_folder(self, prefix):
+        """Dossier temporaire propre à la session (supprimé avec elle)"""
+        return tempfile.mkdtemp(prefix=prefix, dir=self.temp_folder)
+
+
+def _files_size(paths):
+    total = 0
+    for path in paths:
+        try:
+            total += os.path.getsize(path)
+        except OSError:
+            pass
+    return total
+
+
+_last_gc = 0.0
+_gc_lock = threading.Lock()
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def get_workspace(session_id):
+    """Retourne l'espace de travail d'une session, créé au besoin, et marque son activité.
+
+    Les espaces abandonnés sont nettoyés au passage, au plus une fois par WORKSPACE_GC_INTERVAL.
+    """
+    root = os.path.join(WORKSPACE_ROOT, session_id)
+    created = not os.path.isdir(root)
+    workspace = Workspace(session_id=session_id, root=root, created=created)
+    for folder in (workspace.input_folder, workspace.output_folder, workspace.pdf_folder, workspace.temp_folder):
+        os.makedirs(folder, exist_ok=True)
+    workspace.touch()
+    collect_garbage(keep=session_id)
+    return workspace
+
+
+def collect_garbage(ttl=None, keep=None, force=False):
+    """Supprime les espaces de travail inactifs depuis plus de `ttl` secondes ; retourne leur nombre"""
+    global _last_gc
+    ttl = WORKSPACE_TTL if ttl is None else ttl
+    now = time.time()
+    with _gc_lock:
+        if not force and time.monotonic() - _last_gc < WORKSPACE_GC_INTERVAL:
+            return 0
+        _last_gc = time.monotonic()
+    removed = 0
+    try:
+        entries = list(os.scandir(WORKSPACE_ROOT))
+    except OSError:
+        return 0
+    for entry in entries:
+        if not entry.is_dir(follow_symlinks=False) or entry.name == keep:
+            continue
+        try:
+            last_seen = os.stat(os.path.join(entry.path, LAST_SEEN_NAME)).st_mtime
+        except OSError:
+            # Espace sans marqueur (création interrompue) : date du dossier
+            last_seen = entry.stat(follow_symlinks=False).st_mtime
+        if now - last_seen > ttl:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            removed += 1
+    return removed
@@ -0,0 +1,332 @@
+import html
+import posixpath
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+from placeholders import PlaceholderReplacer
+from ooxml_stream import (
+    NS_A, NS_CT, NS_PKG_REL, NS_R, RT_IMAGE, UnsupportedPackageError, copy_raw_entry,
+    _main_document_part, _new_entry, _read_xml, _rels_name, _resolve_target, _serialize,
+)
+from logo_assets import get_logo_asset
+from processing_report import ProcessingReport
+
+NS_XDR = "http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing"
+NS_SHEET = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+
+RT_WORKSHEET = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"
+RT_SHARED_STRINGS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"
+RT_DRAWING = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/drawing"
+CT_DRAWING = "application/vnd.openxmlformats-officedocument.drawing+xml"
+
+# Identifiants fixes des éléments ajoutés
+DRAWING_REL_ID = "rIdPlaceAndReplaceDrawing"
+LOGO_REL_ID = "rIdPlaceAndReplaceLogo"
+
+# Logo en haut à gauche de la première feuille : 150 x 75 pixels, comme avec openpyxl
+EMU_PER_PIXEL = 9525
+LOGO_WIDTH_PX = 150
+LOGO_HEIGHT_PX = 75
+
+CHUNK_SIZE = 1024 * 1024
+
+# Chaînes partagées (<si>) et chaînes en ligne (<is>) ; dans chacune, les textes <t>
+# (les indications phonétiques <rPh> ne sont pas modifiées)
+_STRING_ITEM = re.compile(r"<(si|is)>(.*?)</\1>", re.S)
+# (un <t/> vide est reconnu à part : il ne doit pas être lu comme l'ouverture du <t> suivant)
+_TEXT = re.compile(r"<rPh\b.*?</rPh>|<t(?:\s[^>]*)?/>|<t(?:\s[^>]*)?(?<!/)>(.*?)</t>", re.S)
+# Guillemet ouvrant d'une variable, littéral ou sous forme de référence de caractère
+_OPENING_QUOTE = re.compile(rb"\xc2\xab|&#171;|&#x0*[aA][bB];")
+_ROOT = re.compile(rb"<(\w+:)?(worksheet|sst)\b")
+_ROW_NUMBER = re.compile(rb'<row\b[^>]*?\sr="(\d+)"')
+_DIMENSION = re.compile(rb'(<dimension\b[^>]*?\sref=")([A-Z]+)(\d+)(?::([A-Z]+)(\d+))?(")')
+_SHEET_DATA_END = re.compile(rb"</sheetData>|<sheetData\s*/>")
+_TAG = re.compile(rb"<(/?)([A-Za-z_][\w:.-]*)((?:[^>\"']|\"[^\"]*\"|'[^']*')*?)(/?)>")
+
+# Éléments de feuille placés après <drawing> dans l'ordre imposé par le schéma
+_AFTER_DRAWING = {b"legacyDrawing", b"legacyDrawingHF", b"drawingHF", b"picture", b"oleObjects",
+                  b"controls", b"webPublishItems", b"tableParts", b"extLst"}
+
+
+def _iter_blocks(source, boundary):
+    """Découpe un flux XML en blocs se terminant juste après une balise de fin `boundary`.
+
+    Le dernier bloc contient la fin de la partie après la dernière balise `boundary`.
+    """
+    pending = b""
+    for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+        pending += chunk
+        end = pending.rfind(boundary)
+        if end >= 0:
+            end += len(boundary)
+            yield pending[:end], False
+            pending = pending[end:]
+    yield pending, True
+
+
+def _check_root(block, part_name):
+    match = _ROOT.search(block)
+    if match and match.group(1):
+        raise UnsupportedPackageError(f"Préfixe d'espace de noms inattendu dans {part_name}")
+
+
+def _replace_strings(block, replacer, kinds):
+    """Remplace les variables des chaînes d'un bloc XML complet ; retourne None s'il n'a pas changé"""
+    if not _OPENING_QUOTE.search(block):
+        return None
+    text = block.decode("utf-8")
+    changed = False
+
+    def replace_item(match):
+        nonlocal changed
+        if match.group(1) not in kinds:
+            return match.group(0)
+        body = match.group(2)
+        texts = [m for m in _TEXT.finditer(body) if m.group(1) is not None]
+        replaced = replacer.replace_segments([html.unescape(m.group(1)) for m in texts])
+        if replaced is None:
+            return match.group(0)
+        changed = True
+        # En partant de la fin, les positions des textes précédents restent valables
+        for m, new in reversed(list(zip(texts, replaced))):
+            element = f'<t xml:space="preserve">{escape(new, {chr(13): "&#13;"})}</t>'
+            body = body[:m.start()] + element + body[m.end():]
+        return f"<{match.group(1)}>{body}</{match.group(1)}>"
+
+    text = _STRING_ITEM.sub(replace_item, text)
+    return text.encode("utf-8") if changed else None
+
+
+def _footer_row_xml(row_number, footer_text):
+    text = escape(footer_text, {"\r": "&#13;"})
+    return (f'<row r="{row_number}"><c r="A{row_number}" t="inlineStr">'
+            f'<is><t xml:space="preserve">{text}</t></is></c></row>').encode("utf-8")
+
+
+def _extend_dimension(block):
+    """Étend la plage <dimension> de la feuille à la ligne du pied de page.
+
+    La ligne est annoncée au début de la feuille, avant que ses lignes soient lues : elle suit
+    la dernière ligne déclarée. Retourne (bloc, numéro de la ligne du pied de page ou None).
+    """
+    data_start = block.find(b"<sheetData")
+    match = _DIMENSION.search(block, 0, data_start if data_start >= 0 else len(block))
+    if match is None:
+        return block, None
+    first_row = int(match.group(3))
+    last_column = match.group(4) or match.group(2)
+    last_row = int(match.group(5) or match.group(3))
+    footer_row = last_row + 2
+    ref = b"A%d:%s%d" % (first_row, last_column, footer_row)
+    return block[:match.start()] + match.group(1) + ref + match.group(6) + block[match.end():], footer_row
+
+
+def _drawing_position(tail, part_name):
+    """Position d'insertion de <drawing> parmi les éléments qui suivent <sheetData>"""
+    depth = 0
+    for match in _TAG.finditer(tail):
+        closing, name, _, self_closing = match.group(1), match.group(2), match.group(3), match.group(4)
+        if closing:
+            if depth == 0:
+                # Fin de <worksheet>
+                return match.start()
+            depth -= 1
+            continue
+        if depth == 0:
+            if name == b"drawing":
+                raise UnsupportedPackageError(f"La feuille {part_name} contient déjà des dessins")
+            if name in _AFTER_DRAWING:
+                return match.start()
+        if not self_closing:
+            depth += 1
+    raise UnsupportedPackageError(f"Fin de feuille introuvable dans {part_name}")
+
+
+def _last_row_start(block, end):
+    """Position de la dernière balise <row> avant `end` (et non <rowBreaks>, par exemple)"""
+    start = block.rfind(b"<row", 0, end)
+    while start >= 0 and block[start + 4:start + 5] not in (b" ", b"\t", b"\r", b"\n", b">", b"/"):
+        start = block.rfind(b"<row", 0, start)
+    return start
+
+
+def _rewrite_sheet(source, target, part_name, replacer, footer_text, with_drawing):
+    """Réécrit une feuille par blocs de lignes : chaînes en ligne, ligne de pied de page, dessin du logo"""
+    replacer.part = part_name
+    last_row = 0
+    # Ligne du pied de page annoncée par <dimension>, s'il y en a une
+    footer_row = None
+    first = True
+    for block, final in _iter_blocks(source, b"</row>"):
+        if first:
+            _check_root(block, part_name)
+            if footer_text:
+                block, footer_row = _extend_dimension(block)
+            first = False
+        replaced = _replace_strings(block, replacer, ("is",))
+        if replaced is not None:
+            block = replaced
+        end = _SHEET_DATA_END.search(block) if final else None
+        if final and end is None:
+            raise UnsupportedPackageError(f"Données de feuille introuvables dans {part_name}")
+        start = _last_row_start(block, end.start() if end else len(block))
+        if start >= 0:
+            match = _ROW_NUMBER.match(block, start)
+            if match is None:
+                raise UnsupportedPackageError(f"Ligne sans numéro dans {part_name}")
+            last_row = int(match.group(1))
+        if not final:
+            target.write(block)
+            continue
+
+        head, tail = block[:end.start()], block[end.end():]
+        rows = b""
+        if footer_text:
+            row_number = max(last_row, 1) + 2
+            if footer_row is not None:
+                if row_number > footer_row:
+                    # Lignes au-delà de la plage déclarée : la dimension déjà écrite serait fausse
+                    raise UnsupportedPackageError(f"Dimension de {part_name} en retard sur ses lignes")
+                row_number = footer_row
+            rows = _footer_row_xml(row_number, footer_text)
+        if end.group(0).startswith(b"</"):
+            head += rows + b"</sheetData>"
+        else:
+            head += b"<sheetData>" + rows + b"</sheetData>"
+        if with_drawing:
+            position = _drawing_position(tail, part_name)
+            drawing = f'<drawing xmlns:r="{NS_R}" r:id="{DRAWING_REL_ID}"/>'.encode("utf-8")
+            tail = tail[:position] + drawing + tail[position:]
+        target.write(head + tail)
+
+
+def _rewrite_shared_strings(source, target, part_name, replacer):
+    replacer.part = part_name
+    first = True
+    for block, _ in _iter_blocks(source, b"</si>"):
+        if first:
+            _check_root(block, part_name)
+            first = False
+        replaced = _replace_strings(block, replacer, ("si",))
+        target.write(block if replaced is None else replaced)
+
+
+def _drawing_xml(logo):
+    cx = LOGO_WIDTH_PX * EMU_PER_PIXEL
+    cy = LOGO_HEIGHT_PX * EMU_PER_PIXEL
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        f'<xdr:wsDr xmlns:xdr="{NS_XDR}" xmlns:a="{NS_A}" xmlns:r="{NS_R}">'
+        "<xdr:oneCellAnchor>"
+        "<xdr:from><xdr:col>0</xdr:col><xdr:colOff>0</xdr:colOff><xdr:row>0</xdr:row><xdr:rowOff>0</xdr:rowOff></xdr:from>"
+        f'<xdr:ext cx="{cx}" cy="{cy}"/>'
+        f'<xdr:pic><xdr:nvPicPr><xdr:cNvPr id="1" name="{logo.name}"/>'
+        '<xdr:cNvPicPr><a:picLocks noChangeAspect="1"/></xdr:cNvPicPr></xdr:nvPicPr>'
+        f'<xdr:blipFill><a:blip r:embed="{LOGO_REL_ID}"/><a:stretch><a:fillRect/></a:stretch></xdr:blipFill>'
+        '<xdr:spPr><a:prstGeom prst="rect"><a:avLst/></a:prstGeom></xdr:spPr></xdr:pic>'
+        "<xdr:clientData/></xdr:oneCellAnchor></xdr:wsDr>"
+    )
+
+
+def _relationships(root, rel_id, rel_type, target):
+    """Ajoute (ou remplace) une relation et retourne la partie de relations sérialisée"""
+    if root is None:
+        root = ET.Element(f"{{{NS_PKG_REL}}}Relationships")
+    for rel in list(root):
+        if rel.get("Id") == rel_id:
+            root.remove(rel)
+    ET.SubElement(root, f"{{{NS_PKG_REL}}}Relationship", {"Id": rel_id, "Type": rel_type, "Target": target})
+    return _serialize(root, NS_PKG_REL)
+
+
+def _workbook_parts(zin):
+    """Feuilles de calcul dans l'ordre du classeur et partie des chaînes partagées"""
+    workbook = _main_document_part(zin)
+    rels = {}
+    shared_strings = None
+    for rel in _read_xml(zin, _rels_name(workbook)):
+        if rel.get("TargetMode") == "External":
+            continue
+        target = _resolve_target(workbook, rel.get("Target"))
+        if rel.get("Type") == RT_WORKSHEET:
+            rels[rel.get("Id")] = target
+        elif rel.get("Type") == RT_SHARED_STRINGS:
+            shared_strings = target
+    sheets = []
+    for sheet in _read_xml(zin, workbook).iter(f"{{{NS_SHEET}}}sheet"):
+        target = rels.get(sheet.get(f"{{{NS_R}}}id"))
+        if target:
+            sheets.append(target)
+    if not sheets:
+        raise UnsupportedPackageError("Aucune feuille de calcul trouvée")
+    return sheets, shared_strings
+
+
+def _next_drawing_name(names):
+    index = 1
+    while f"xl/drawings/drawing{index}.xml" in names:
+        index += 1
+    return f"xl/drawings/drawing{index}.xml"
+
+
+def rewrite_xlsx(source, target, client_data=None, footer_text=None, logo_path=None):
+    """Réécrit un .xlsx au niveau XML, sans charger le classeur.
+
+    Chaque chaîne partagée est traitée une seule fois, quel que soit le nombre de cellules
+    qui la référencent ; les feuilles sont recopiées par blocs de lignes (chaînes en ligne,
+    ligne de pied de page) et toutes les autres entrées avec leurs octets compressés d'origine.
+    Retourne le rapport de traitement.
+    """
+    replacer = PlaceholderReplacer(client_data or {})
+    logo = get_logo_asset(logo_path) if logo_path else None
+    report = ProcessingReport(engine="stream")
+
+    with zipfile.ZipFile(source) as zin, zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as zout:
+        names = set(zin.namelist())
+        sheets, shared_strings = _workbook_parts(zin)
+        logo_sheet = sheets[0] if logo else None
+        drawing = _next_drawing_name(names) if logo else None
+        sheet_set = set(sheets)
+
+        for info in zin.infolist():
+            name = info.filename
+            if name in sheet_set and (footer_text or client_data or name == logo_sheet):
+                with zin.open(info) as f, zout.open(_new_entry(name, info.date_time), "w") as out:
+                    _rewrite_sheet(f, out, name, replacer, footer_text, name == logo_sheet)
+            elif name == shared_strings and client_data:
+                with zin.open(info) as f, zout.open(_new_entry(name, info.date_time), "w") as out:
+                    _rewrite_shared_strings(f, out, name, replacer)
+            elif logo and name == "[Content_Types].xml":
+                root = _read_xml(zin, name)
+                extensions = {element.get("Extension", "").lower() for element in root.findall(f"{{{NS_CT}}}Default")}
+                if logo.extension not in extensions:
+                    ET.SubElement(root, f"{{{NS_CT}}}Default",
+                                  {"Extension": logo.extension, "ContentType": logo.content_type})
+                ET.SubElement(root, f"{{{NS_CT}}}Override", {"PartName": f"/{drawing}", "ContentType": CT_DRAWING})
+                zout.writestr(_new_entry(name, info.date_time), _serialize(root, NS_CT))
+            elif logo and name == _rels_name(logo_sheet):
+                rels = _relationships(_read_xml(zin, name), DRAWING_REL_ID, RT_DRAWING,
+                                      posixpath.relpath(drawing, posixpath.dirname(logo_sheet)))
+                zout.writestr(_new_entry(name, info.date_time), rels)
+            else:
+                copy_raw_entry(zin, info, zout)
+
+        if logo:
+            if _rels_name(logo_sheet) not in names:
+                rels = _relationships(None, DRAWING_REL_ID, RT_DRAWING,
+                                      posixpath.relpath(drawing, posixpath.dirname(logo_sheet)))
+                zout.writestr(_new_entry(_rels_name(logo_sheet)), rels)
+            media = posixpath.join("xl/media", logo.name)
+            zout.writestr(_new_entry(drawing), _drawing_xml(logo))
+            zout.writestr(_new_entry(_rels_name(drawing)),
+                          _relationships(None, LOGO_REL_ID, RT_IMAGE,
+                                         posixpath.relpath(media, posixpath.dirname(drawing))))
+            if media not in names:
+                zout.writestr(_new_entry(media), logo.data)
+            report.logo_embedded = True
+
+    report.footers_rewritten = len(sheets) if footer_text else 0
+    report.add_substitutions(replacer.counts)
+    return report
@@ -0,0 +1,75 @@
+import os
+import zipfile
+from datetime import datetime
+
+# Fichiers déjà compressés (les formats OOXML sont eux-mêmes des archives ZIP) :
+# ils sont stockés tels quels, les recompresser coûte du CPU pour un gain quasi nul
+STORED_EXTENSIONS = {'.docx', '.xlsx', '.pptx', '.zip', '.png', '.jpg', '.jpeg'}
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class _ChunkSink:
+    """Destination d'écriture non positionnable : les octets écrits sont récupérés par morceaux"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks = self._chunks
+        self._chunks = []
+        return chunks
+
+
+def compression_for(arcname):
+    """Méthode de compression d'une entrée selon son extension"""
+    if os.path.splitext(arcname)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def iter_zip_stream(entries):
+    """Produit une archive ZIP par morceaux, au fur et à mesure de l'écriture des entrées.
+
+    entries : itérable de (nom dans l'archive, source) où la source est un chemin de fichier
+    ou des octets. L'archive complète n'est jamais conservée en mémoire.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w") as archive:
+        for arcname, source in entries:
+            if isinstance(source, (bytes, bytearray)):
+                info = zipfile.ZipInfo(arcname, date_time=datetime.now().timetuple()[:6])
+                info.file_size = len(source)
+                chunks = [source[i:i + CHUNK_SIZE] for i in range(0, len(source), CHUNK_SIZE)]
+                f = None
+            else:
+                info = zipfile.ZipInfo.from_file(source, arcname)
+                f = open(source, "rb")
+                chunks = iter(lambda: f.read(CHUNK_SIZE), b"")
+            info.compress_type = compression_for(arcname)
+            try:
+                with archive.open(info, "w") as dest:
+                    for chunk in chunks:
+                        dest.write(chunk)
+                        yield from sink.drain()
+            finally:
+                if f is not None:
+                    f.close()
+            yield from sink.drain()
+    yield from sink.drain()
+
+
+def write_zip_stream(entries, fileobj):
+    """Écrit une archive ZIP en flux dans un fichier ouvert et retourne sa taille"""
+    size = 0
+    for chunk in iter_zip_stream(entries):
+        fileobj.write(chunk)
+        size += len(chunk)
+    return size